@@ -2,6 +2,8 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from datetime import timedelta
 import os
 
 app = Flask(__name__)
@@ -13,30 +15,106 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///docky.db'
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Threaded workers (see gunicorn.conf.py) each need a connection: size the pool
+# to the thread count. SQLite gets a busy timeout instead of a pool.
+if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+else:
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WEB_THREADS', 8))),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 4)),
+        'pool_timeout': 10,
+        'pool_pre_ping': True,
+        'pool_recycle': 1800,
+    }
 app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY', 'super-secret-key')
+# Short-lived access tokens; clients renew them at /api/auth/refresh instead of logging in again
+app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=int(os.environ.get('JWT_ACCESS_MINUTES', 15)))
+app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=int(os.environ.get('JWT_REFRESH_DAYS', 7)))
+# Werkzeug hash method for new and upgraded passwords, e.g. 'pbkdf2:sha256:200000'
+# or 'scrypt:16384:8:1'; stored hashes using another method are rehashed on login
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
 app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(os.path.dirname(__file__), 'uploads'))
+# Chunked uploads: largest accepted chunk and largest accepted file, in bytes
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 8 * 1024 * 1024))
+app.config['MAX_UPLOAD_SIZE'] = int(os.environ.get('MAX_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+# Chunked uploads idle this many hours are abandoned: their row and partial file are removed
+app.config['UPLOAD_EXPIRY_HOURS'] = float(os.environ.get('UPLOAD_EXPIRY_HOURS', 24))
+# How file bytes reach the client: 'direct' (Flask streams them), 'x-accel'
+# (nginx X-Accel-Redirect to X_ACCEL_PREFIX) or 'x-sendfile' (X-Sendfile header)
+app.config['FILE_SERVING_MODE'] = os.environ.get('FILE_SERVING_MODE', 'direct')
+app.config['X_ACCEL_PREFIX'] = os.environ.get('X_ACCEL_PREFIX', '/protected-uploads/')
+app.config['USE_X_SENDFILE'] = app.config['FILE_SERVING_MODE'] == 'x-sendfile'
+# Upper bound in bytes for the on-disk thumbnail/preview cache
+app.config['PREVIEW_CACHE_SIZE'] = int(os.environ.get('PREVIEW_CACHE_SIZE', 512 * 1024 * 1024))
+# Background jobs: worker threads per process (0 = run utils/run_jobs.py instead),
+# idle poll interval and how long a 'running' job may go without finishing, in seconds
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))
+app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 2))
+app.config['JOB_TIMEOUT'] = int(os.environ.get('JOB_TIMEOUT', 600))
+# Seconds a process may serve its cached Settings row to dashboards before
+# checking the version; the upload deadline check always checks it
+app.config['SETTINGS_CACHE_TTL'] = float(os.environ.get('SETTINGS_CACHE_TTL', 5))
+# Server-sent event streams: poll interval, lifetime before the client reconnects
+# (re-checking its token), and how many may be open at once per process
+app.config['CHANGE_STREAM_INTERVAL'] = float(os.environ.get('CHANGE_STREAM_INTERVAL', 1))
+app.config['CHANGE_STREAM_MAX_AGE'] = int(os.environ.get('CHANGE_STREAM_MAX_AGE', 300))
+app.config['CHANGE_STREAM_LIMIT'] = int(os.environ.get('CHANGE_STREAM_LIMIT', 4))
+# Instrumentation (see instrumentation.py): /metrics, per-request SQL counts and
+# slow-request profiles are off unless METRICS_ENABLED=1
+app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO')
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 0))
+app.config['PROFILE_INTERVAL_MS'] = int(os.environ.get('PROFILE_INTERVAL_MS', 5))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'profiles'))
 
 # Use environment variable for CORS origins for flexibility on Render
-CORS(app, origins=["https://docky-1.onrender.com"])
+CORS(app, origins=["https://docky-1.onrender.com"], expose_headers=["X-Next-Cursor", "X-Changes-Cursor", "ETag", "Content-Range", "Accept-Ranges"])
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
 
+import instrumentation
+instrumentation.init_app(app, db)
+
+with app.app_context():
+    if db.engine.dialect.name == 'sqlite':
+        # WAL lets dashboard reads proceed while an upload is committing
+        @event.listens_for(db.engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+
 # Register blueprints
 from routes.auth import auth_bp
 from routes.documents import documents_bp
 from routes.admin import admin_bp
 from routes.settings import settings_bp
+from routes.previews import previews_bp
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(documents_bp, url_prefix='/api/documents')
+app.register_blueprint(previews_bp, url_prefix='/api/documents')
 app.register_blueprint(admin_bp, url_prefix='/api/admin')
 app.register_blueprint(settings_bp, url_prefix='/api/settings')
 
+# Post-upload job handlers; worker threads start with the first request so
+# each forked gunicorn worker gets its own pool
+import tasks
+from jobs import start_workers
+app.before_request(start_workers)
+
 # The temporary seed route has been removed for security.
 
 # Create tables if not exist
+from utils.schema import upgrade_schema
+from search import init_search
 with app.app_context():
     db.create_all()
+    upgrade_schema(db)
+    init_search(db)
 
 # Temporary route to create admin user (REMOVE after use)
 @app.route('/create_admin')
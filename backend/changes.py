@@ -0,0 +1,149 @@
+"""Incremental change feeds, so dashboards stop re-fetching whole document lists.
+
+Every write to a Document takes a change_seq and bumps its version (see
+models.py). change_seq comes from a counter row locked until the writing
+transaction ends, so numbers become visible in order: once a reader sees
+change_seq N committed, every write numbered below N has committed too, and
+no row can still turn up with a number at or below the counter. A feed
+cursor is the (change_seq, id) of the last row a client has seen, with id 0
+once it has seen every row of that change_seq; a feed page holds the rows written after it plus the ids deleted after it, read
+from DocumentTombstone, which numbers deletions the same way. A client may
+receive a row it already has (for example right after a full list fetch) and
+should keep whichever copy has the higher version, applying deletions first.
+
+List endpoints hand out a starting cursor in the X-Changes-Cursor header.
+Cursors from before the newest pruned tombstone (TOMBSTONE_RETENTION) are
+refused with 410, since deletions before then are forgotten; the client
+reloads the full list instead.
+"""
+import base64
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import jsonify
+from sqlalchemy import and_, or_, func
+from app import app, db
+from models import Document, DocumentTombstone, ChangeCounter
+
+TOMBSTONE_RETENTION = timedelta(days=7)
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+KEEPALIVE_SECONDS = 15
+
+_stream_slots = threading.BoundedSemaphore(app.config['CHANGE_STREAM_LIMIT'])
+
+
+def encode_cursor(seq, doc_id):
+    raw = f"{seq}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    seq, doc_id = raw.split('|')
+    if not seq.isdigit():
+        # Cursors handed out before change_seq held a timestamp; expire them
+        datetime.fromisoformat(seq)
+        return -1, int(doc_id)
+    return int(seq), int(doc_id)
+
+
+def counter():
+    """(newest committed change_seq, newest pruned change_seq)."""
+    row = db.session.get(ChangeCounter, 1, populate_existing=True)
+    return (row.value, row.pruned) if row else (0, 0)
+
+
+def head_cursor():
+    """Cursor for "now": changes made after a list fetch arrive on the feed."""
+    return encode_cursor(counter()[0], 0)
+
+
+def record_deletions(docs):
+    """Add tombstones for documents about to be deleted, in the caller's transaction."""
+    now = datetime.utcnow()
+    db.session.add_all([DocumentTombstone(document_id=d.id, user_id=d.user_id, deleted_at=now) for d in docs])
+    db.session.flush()
+    expired = DocumentTombstone.query.filter(DocumentTombstone.deleted_at < now - TOMBSTONE_RETENTION)
+    pruned = expired.with_entities(func.max(DocumentTombstone.change_seq)).scalar()
+    if pruned is not None:
+        # The flush above took the counter row, so it exists and is ours until commit
+        ChangeCounter.query.filter(ChangeCounter.id == 1, ChangeCounter.pruned < pruned).update(
+            {'pruned': pruned}, synchronize_session=False)
+    expired.delete(synchronize_session=False)
+
+
+def changes_since(query, tombstones, cursor, limit=DEFAULT_PAGE_SIZE):
+    """One page of a change feed.
+
+    `query` selects the visible documents (Document, or Document plus extra
+    columns) and `tombstones` the visible DocumentTombstone rows. Returns
+    ({'rows', 'deleted', 'cursor', 'has_more'}, None), or (None, error
+    response) for a bad or expired cursor.
+    """
+    try:
+        since, last_id = decode_cursor(cursor)
+    except Exception:
+        return None, (jsonify({'error': 'Invalid cursor'}), 400)
+    # Read first: every change numbered up to `end` has committed by now
+    end, pruned = counter()
+    if since < pruned:
+        return None, (jsonify({'error': 'Cursor expired; reload the full list'}), 410)
+    after = Document.change_seq > since
+    if last_id:
+        after = or_(after, and_(Document.change_seq == since, Document.id > last_id))
+    rows = (query.filter(Document.change_seq <= end, after)
+            .order_by(Document.change_seq, Document.id)
+            .limit(limit + 1).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if has_more:
+        # Stop where this page stops; the rest is the next page's
+        last = rows[-1] if isinstance(rows[-1], Document) else rows[-1][0]
+        end = last.change_seq
+        next_cursor = encode_cursor(last.change_seq, last.id)
+    else:
+        next_cursor = encode_cursor(max(since, end), 0)
+    deleted = tombstones.filter(DocumentTombstone.change_seq > since,
+                                DocumentTombstone.change_seq <= end).order_by(DocumentTombstone.id).all()
+    return {
+        'rows': rows,
+        'deleted': [t.document_id for t in deleted],
+        'cursor': next_cursor,
+        'has_more': has_more
+    }, None
+
+
+def acquire_stream_slot():
+    """Reserve one of the CHANGE_STREAM_LIMIT streams of this process; False if all are busy."""
+    return _stream_slots.acquire(blocking=False)
+
+
+def release_stream_slot():
+    _stream_slots.release()
+
+
+def event_stream(poll, cursor):
+    """Server-sent events for a feed; `poll(cursor)` returns a page as JSON-ready dict.
+
+    Each page with changes is sent as a "changes" event whose id is the page's
+    cursor, so EventSource resumes from it (Last-Event-ID) after the stream
+    ends at CHANGE_STREAM_MAX_AGE or the connection drops.
+    """
+    interval = app.config['CHANGE_STREAM_INTERVAL']
+    deadline = time.monotonic() + app.config['CHANGE_STREAM_MAX_AGE']
+    last_sent = time.monotonic()
+    yield f"retry: {int(interval * 1000) + 2000}\n\n"
+    while time.monotonic() < deadline:
+        page = poll(cursor)
+        # End the read transaction, or SQLite keeps serving this snapshot
+        db.session.rollback()
+        cursor = page['cursor']
+        if page['changes'] or page['deleted']:
+            yield f"id: {cursor}\nevent: changes\ndata: {app.json.dumps(page)}\n\n"
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent >= KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        if not page['has_more']:
+            time.sleep(interval)
@@ -0,0 +1,20 @@
+# gunicorn settings, picked up automatically when starting `gunicorn app:app`
+# from this directory.
+#
+# The default 'gthread' worker serves each request on a thread, so a slow
+# client holding an upload chunk or a download only occupies one thread, not
+# a whole worker process. Set WEB_WORKER_CLASS=sync for the old behaviour or
+# =gevent if gevent is installed.
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+# gunicorn silently swaps 'sync' for 'gthread' when threads > 1
+threads = int(os.environ.get('WEB_THREADS', 8)) if worker_class != 'sync' else 1
+worker_connections = int(os.environ.get('WEB_CONNECTIONS', 1000))  # gevent only
+# Long enough for a full upload chunk over a slow mobile link
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+keepalive = 5
+# send_file responses go out through sendfile(2) instead of Python reads
+sendfile = True
@@ -0,0 +1,228 @@
+"""Opt-in request instrumentation: Prometheus metrics, SQL counts, logging, profiling.
+
+Enabled with METRICS_ENABLED=1. Every request then records its latency, the
+number and total duration of SQL statements it ran (from SQLAlchemy engine
+events, so an N+1 loop shows up as a high count on one endpoint) and, for
+file responses, the bytes sent. GET /metrics exposes them in the Prometheus
+text format. Metrics are kept per process; with several gunicorn workers
+each scrape sees the worker that answered, labelled with its pid.
+
+PROFILE_SLOW_MS=<n> additionally samples the stack of every request thread
+every PROFILE_INTERVAL_MS and writes requests slower than n ms as folded
+stacks (flamegraph.pl / speedscope input) into PROFILE_DIR.
+
+Logs go through a QueueHandler, so request threads never block on the
+stream; each record is one JSON line.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from collections import defaultdict
+from flask import g, request, Response
+from sqlalchemy import event
+
+logger = logging.getLogger('docky')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500)
+BYTES_BUCKETS = (1024, 64 * 1024, 1024 ** 2, 10 * 1024 ** 2, 100 * 1024 ** 2, 1024 ** 3)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.setdefault(labels, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self, label_names, extra):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = list(self.series.items())
+        for labels, series in items:
+            base = ','.join(f'{k}="{v}"' for k, v in zip(label_names, labels)) + extra
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f'{self.name}_sum{{{base}}} {series[-2]}')
+            lines.append(f'{self.name}_count{{{base}}} {series[-1]}')
+        return lines
+
+
+REQUEST_LABELS = ('endpoint', 'method', 'status')
+ENDPOINT_LABELS = ('endpoint',)
+request_seconds = Histogram('docky_request_duration_seconds', 'Request latency.', LATENCY_BUCKETS)
+request_sql_count = Histogram('docky_request_sql_statements', 'SQL statements executed per request.', SQL_COUNT_BUCKETS)
+request_sql_seconds = Histogram('docky_request_sql_duration_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+response_file_bytes = Histogram('docky_file_response_bytes', 'Bytes sent per file response.', BYTES_BUCKETS)
+
+
+def render_metrics():
+    extra = f',pid="{os.getpid()}"'
+    lines = []
+    lines += request_seconds.render(REQUEST_LABELS, extra)
+    lines += request_sql_count.render(ENDPOINT_LABELS, extra)
+    lines += request_sql_seconds.render(ENDPOINT_LABELS, extra)
+    lines += response_file_bytes.render(ENDPOINT_LABELS, extra)
+    return '\n'.join(lines) + '\n'
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def setup_logging(level):
+    """Route the 'docky' logger through a background queue listener."""
+    if getattr(logger, '_queue_listener', None):
+        return
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(JsonFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    logger.setLevel(level)
+    logger.propagate = False
+    logger._queue_listener = listener
+
+
+class StackSampler:
+    """One thread per process that samples the stacks of in-flight requests."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}  # thread id -> folded stack counts
+        self.lock = threading.Lock()
+        threading.Thread(target=self.loop, name='docky-profiler', daemon=True).start()
+
+    def begin(self):
+        with self.lock:
+            self.active[threading.get_ident()] = defaultdict(int)
+
+    def end(self):
+        with self.lock:
+            return self.active.pop(threading.get_ident(), None)
+
+    def loop(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self.lock:
+                for ident, stacks in self.active.items():
+                    frame = frames.get(ident)
+                    parts = []
+                    while frame is not None:
+                        code = frame.f_code
+                        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    if parts:
+                        stacks[';'.join(reversed(parts))] += 1
+
+
+def counted(iterable, on_close):
+    """Wrap a streamed body, reporting how many bytes actually went out."""
+    sent = 0
+    try:
+        for chunk in iterable:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(iterable, 'close'):
+            iterable.close()
+        on_close(sent)
+
+
+def init_app(app, db):
+    setup_logging(app.config['LOG_LEVEL'])
+    if not app.config['METRICS_ENABLED']:
+        return
+    sampler = StackSampler(app.config['PROFILE_INTERVAL_MS'] / 1000) if app.config['PROFILE_SLOW_MS'] else None
+    sql_stats = threading.local()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        sql_stats.started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = getattr(sql_stats, 'current', None)
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - sql_stats.started
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        sql_stats.current = [0, 0.0]
+        if sampler:
+            sampler.begin()
+
+    @app.after_request
+    def record_request(response):
+        endpoint = request.endpoint or 'unmatched'
+        elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+        sql_count, sql_seconds = getattr(sql_stats, 'current', None) or (0, 0.0)
+        sql_stats.current = None
+        request_seconds.observe((endpoint, request.method, response.status_code), elapsed)
+        request_sql_count.observe((endpoint,), sql_count)
+        request_sql_seconds.observe((endpoint,), sql_seconds)
+        fields = {'method': request.method, 'path': request.path, 'endpoint': endpoint,
+                  'status': response.status_code, 'duration_ms': round(elapsed * 1000, 2),
+                  'sql_count': sql_count, 'sql_ms': round(sql_seconds * 1000, 2)}
+        if response.direct_passthrough or response.is_streamed:
+            if response.content_length is not None:
+                response_file_bytes.observe((endpoint,), response.content_length)
+                fields['bytes'] = response.content_length
+            else:
+                response.response = counted(response.response,
+                                            lambda sent: response_file_bytes.observe((endpoint,), sent))
+        logger.info('request', extra={'fields': fields})
+        if sampler:
+            stacks = sampler.end()
+            if stacks and elapsed * 1000 >= app.config['PROFILE_SLOW_MS']:
+                dump_profile(app.config['PROFILE_DIR'], endpoint, elapsed, stacks)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        if token and request.headers.get('Authorization') != f"Bearer {token}":
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def dump_profile(folder, endpoint, elapsed, stacks):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{int(time.time() * 1000)}_{endpoint.replace('.', '_')}_{int(elapsed * 1000)}ms.folded")
+    with open(path, 'w') as f:
+        for stack, count in stacks.items():
+            f.write(f"{stack} {count}\n")
+    logger.warning('slow request profiled', extra={'fields': {'endpoint': endpoint, 'duration_ms': round(elapsed * 1000, 2), 'profile': path}})
@@ -0,0 +1,166 @@
+"""Database-backed background job queue for post-upload processing.
+
+Routes call enqueue() in the same transaction that creates the Document, so
+a job exists exactly when its upload does. Every app process runs a small
+pool of worker threads (JOB_WORKERS, started on its first request) that claim
+pending jobs with an atomic UPDATE, which keeps several gunicorn workers from
+running the same job. Failed jobs are retried with exponential backoff up to
+max_attempts. Set JOB_WORKERS=0 and run utils/run_jobs.py to process jobs in
+a separate process instead.
+
+The workers also expire abandoned chunked uploads, at most once per
+SWEEP_INTERVAL per process.
+"""
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_, event
+from sqlalchemy.orm.exc import StaleDataError
+from app import app, db
+from models import Job
+import storage
+from instrumentation import logger
+
+handlers = {}
+_wakeup = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+_next_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+SWEEP_INTERVAL = 3600
+
+
+def handler(kind):
+    """Register a function(job) as the handler for jobs of this kind."""
+    def register(func):
+        handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, document_id=None, max_attempts=3):
+    """Add a job to the current session; it becomes visible on commit."""
+    job = Job(kind=kind, document_id=document_id, max_attempts=max_attempts)
+    db.session.add(job)
+    # Wake a worker once the job is committed; woken earlier it finds nothing
+    # and goes back to sleep for a full poll interval
+    db.session.info['jobs_enqueued'] = True
+    return job
+
+
+@event.listens_for(db.session, 'after_commit')
+def wake_workers(session):
+    if session.info.pop('jobs_enqueued', False):
+        _wakeup.set()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_enqueued(session):
+    session.info.pop('jobs_enqueued', None)
+
+
+def claim_next():
+    """Atomically take the oldest runnable job, or return None."""
+    now = datetime.utcnow()
+    # Jobs left 'running' by a crashed worker become claimable again
+    stale = now - timedelta(seconds=app.config['JOB_TIMEOUT'])
+    runnable = or_(
+        and_(Job.status == 'pending', Job.run_after <= now),
+        and_(Job.status == 'running', Job.updated_at < stale)
+    )
+    candidates = Job.query.filter(runnable).order_by(Job.run_after, Job.id).limit(5).all()
+    for job in candidates:
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job.id, Job.status == job.status, Job.updated_at == job.updated_at)
+            .values(status='running', attempts=Job.attempts + 1, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, job.id)
+    return None
+
+
+def run_job(job):
+    job_id, kind = job.id, job.kind
+    func = handlers.get(kind)
+    try:
+        if func is None:
+            raise LookupError(f"No handler for job kind '{kind}'")
+        func(job)
+        job.status = 'done'
+        job.last_error = None
+        db.session.commit()
+        return
+    except Exception:
+        error = traceback.format_exc(limit=5)
+        db.session.rollback()
+    # Deleting a document deletes its jobs, possibly while one is running
+    job = db.session.get(Job, job_id)
+    if job is None:
+        logger.info('job %s (%s) cancelled: its row was deleted', job_id, kind)
+        return
+    job.last_error = error
+    if job.attempts < job.max_attempts:
+        job.status = 'pending'
+        job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+    else:
+        job.status = 'failed'
+    try:
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        logger.info('job %s (%s) cancelled: its row was deleted', job_id, kind)
+
+
+def run_pending(limit=None):
+    """Run runnable jobs until none are left (or `limit` ran); returns the count."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_next()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
+
+
+def sweep_uploads():
+    """Expire idle chunked uploads if this process hasn't in the last SWEEP_INTERVAL."""
+    global _next_sweep
+    with _sweep_lock:
+        if time.monotonic() < _next_sweep:
+            return
+        _next_sweep = time.monotonic() + SWEEP_INTERVAL
+    expired = storage.expire_uploads(timedelta(hours=app.config['UPLOAD_EXPIRY_HOURS']))
+    if expired:
+        logger.info('expired %d abandoned upload(s)', len(expired))
+
+
+def worker_loop():
+    while True:
+        try:
+            with app.app_context():
+                sweep_uploads()
+                ran = run_pending()
+        except Exception:
+            logger.exception('job worker loop failed')
+            ran = 0
+        if not ran:
+            _wakeup.wait(app.config['JOB_POLL_INTERVAL'])
+            _wakeup.clear()
+
+
+def start_workers():
+    """Start this process's worker threads once; safe to call on every request."""
+    global _started
+    if _started or app.config['JOB_WORKERS'] <= 0:
+        return
+    with _start_lock:
+        if _started:
+            return
+        for i in range(app.config['JOB_WORKERS']):
+            threading.Thread(target=worker_loop, name=f"docky-job-{i}", daemon=True).start()
+        _started = True
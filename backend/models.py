@@ -1,9 +1,40 @@
 from app import db
+from sqlalchemy import literal_column, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from datetime import datetime
 
+
+def next_change_seq(context):
+    """Column default for change_seq: one number per transaction, in commit order.
+
+    The first Document or tombstone write of a transaction bumps the
+    ChangeCounter row, which stays locked until that transaction ends, so a
+    later number is only handed out once every earlier one has committed or
+    rolled back. Every write in the transaction reuses the same number.
+    """
+    conn = context.connection
+    txn = conn.get_transaction()
+    cached = conn.info.get('change_seq')
+    if cached and cached[0] is txn:
+        return cached[1]
+    counter = ChangeCounter.__table__
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        seq = conn.execute(insert(counter).values(id=1, value=1).on_conflict_do_update(
+            index_elements=[counter.c.id], set_={'value': counter.c.value + 1}
+        ).returning(counter.c.value)).scalar_one()
+    else:
+        if not conn.execute(update(counter).where(counter.c.id == 1).values(value=counter.c.value + 1)).rowcount:
+            conn.execute(counter.insert().values(id=1, value=1))
+        seq = conn.execute(select(counter.c.value).where(counter.c.id == 1)).scalar_one()
+    conn.info['change_seq'] = (txn, seq)
+    return seq
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
+    name = db.Column(db.String(100), nullable=False, index=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     hashed_password = db.Column(db.String(200), nullable=False)
     user_type = db.Column(db.String(10), nullable=False)  # 'user' or 'admin'
@@ -11,14 +42,76 @@ class User(db.Model):
 
 class Document(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
     filename = db.Column(db.String(200), nullable=False)
-    upload_datetime = db.Column(db.DateTime, default=datetime.utcnow)
+    upload_datetime = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_viewed = db.Column(db.Boolean, default=False)
     admin_comment = db.Column(db.Text, nullable=True)
+    size = db.Column(db.BigInteger, nullable=True)
+    mime_type = db.Column(db.String(100), nullable=True)  # sniffed after upload
+    # Content hash of the stored blob; NULL for files saved before the blob store
+    sha256 = db.Column(db.String(64), db.ForeignKey('blob.sha256'), nullable=True, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Change feed keys: every INSERT and UPDATE, ORM or bulk, takes a new change_seq
+    # and bumps version. change_seq is NULL on rows untouched since it was added.
+    change_seq = db.Column(db.BigInteger, nullable=True, default=next_change_seq, onupdate=next_change_seq, index=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1',
+                        onupdate=literal_column('version + 1'))
+
+class Blob(db.Model):
+    # One stored file, shared by every Document with the same content
+    sha256 = db.Column(db.String(64), primary_key=True)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class Upload(db.Model):
+    # An in-progress chunked upload; removed once it is completed
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    title = db.Column(db.String(200), nullable=False)
+    description = db.Column(db.Text, nullable=True)
+    original_filename = db.Column(db.String(200), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=True)
+    received_bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    next_chunk = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Last chunk received; storage.expire_uploads removes uploads idle too long
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
 class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     deadline_datetime = db.Column(db.DateTime, nullable=True)
+    # Bumped on every change so cached copies in other processes can tell they are stale
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+class Job(db.Model):
+    # Post-upload work run by the background worker pool in jobs.py
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'), nullable=True, index=True)
+    kind = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DocumentTombstone(db.Model):
+    # Lets change feeds report deletions; pruned after changes.TOMBSTONE_RETENTION.
+    # Not keyed by document id: SQLite may reuse the id of the newest deleted row.
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, nullable=False, index=True)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    change_seq = db.Column(db.BigInteger, nullable=True, default=next_change_seq, index=True)
+
+class ChangeCounter(db.Model):
+    # Single row (id 1) behind next_change_seq. `pruned` is the newest change_seq
+    # whose tombstones have been pruned; cursors before it are expired.
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    pruned = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
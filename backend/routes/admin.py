@@ -1,53 +1,312 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import and_, or_, update, func, case
 from app import db
-from models import Document, User
+from models import Document, User, Job, DocumentTombstone
+import storage
+from search import search_documents
+import changes
+from datetime import datetime, timezone
+import base64
+import csv
+import io
+import os
+import zipfile
+from mimetypes import guess_type
 
 admin_bp = Blueprint('admin', __name__)
 
-@admin_bp.route('/documents', methods=['GET'])
-@jwt_required()
-def all_documents():
-    user = get_jwt_identity()
-    if user['user_type'] != 'admin':
-        return jsonify({'error': 'Unauthorized'}), 403
-    # Filtering logic
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(upload_datetime, doc_id):
+    raw = f"{upload_datetime.isoformat()}|{doc_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    dt, doc_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(dt), int(doc_id)
+
+
+def filtered_documents():
+    """(Document, owner name) query for the admin filters in the request args.
+
+    Returns (query, None), or (None, error response) for a bad filter value.
+    """
     user_name = request.args.get('user_name')
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
-    query = Document.query
+    query = db.session.query(Document, User.name).join(User, Document.user_id == User.id)
     if user_name:
-        user_obj = User.query.filter(User.name.ilike(f"%{user_name}%")).all()
-        user_ids = [u.id for u in user_obj]
-        query = query.filter(Document.user_id.in_(user_ids))
+        query = query.filter(User.name.ilike(f"%{user_name}%"))
     if start_date:
         try:
-            from datetime import datetime
             start_dt = datetime.fromisoformat(start_date)
             query = query.filter(Document.upload_datetime >= start_dt)
         except Exception:
-            return jsonify({'error': 'Invalid start_date format'}), 400
+            return None, (jsonify({'error': 'Invalid start_date format'}), 400)
     if end_date:
         try:
-            from datetime import datetime
             end_dt = datetime.fromisoformat(end_date)
             query = query.filter(Document.upload_datetime <= end_dt)
         except Exception:
-            return jsonify({'error': 'Invalid end_date format'}), 400
-    docs = query.all()
+            return None, (jsonify({'error': 'Invalid end_date format'}), 400)
+    return query, None
+
+
+def document_item(d, owner_name):
+    return {
+        'id': d.id,
+        'user_name': owner_name or '',
+        'title': d.title,
+        'upload_datetime': d.upload_datetime,
+        'filename': d.filename,
+        'is_viewed': d.is_viewed,
+        'admin_comment': d.admin_comment,
+        'file_type': d.mime_type or guess_type(d.filename)[0],
+        'version': d.version
+    }
+
+
+@admin_bp.route('/documents', methods=['GET'])
+@jwt_required()
+def all_documents():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    cursor = request.args.get('cursor')
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    query, error = filtered_documents()
+    if error:
+        return error
+    # Taken before the list is read, so nothing changed meanwhile is missed
+    changes_cursor = changes.head_cursor()
+    if cursor:
+        try:
+            cursor_dt, cursor_id = decode_cursor(cursor)
+        except Exception:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        # Keyset: everything strictly after the last row of the previous page
+        query = query.filter(or_(
+            Document.upload_datetime < cursor_dt,
+            and_(Document.upload_datetime == cursor_dt, Document.id < cursor_id)
+        ))
+    rows = query.order_by(Document.upload_datetime.desc(), Document.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    response = jsonify([document_item(d, owner_name) for d, owner_name in rows])
+    response.headers['X-Changes-Cursor'] = changes_cursor
+    if has_more:
+        last = rows[-1][0]
+        response.headers['X-Next-Cursor'] = encode_cursor(last.upload_datetime, last.id)
+    return response, 200
+
+@admin_bp.route('/documents/summary', methods=['GET'])
+@jwt_required()
+def documents_summary():
+    """Counts for the dashboard cards over every document matching the filters, not just one page."""
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    query, error = filtered_documents()
+    if error:
+        return error
+    # The client's local midnight, so "today" matches what the admin sees
+    today_start = request.args.get('today_start')
+    try:
+        if today_start:
+            today_start = datetime.fromisoformat(today_start)
+            if today_start.tzinfo:
+                today_start = today_start.astimezone(timezone.utc).replace(tzinfo=None)
+        else:
+            today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        return jsonify({'error': 'Invalid today_start format'}), 400
+    total, reviewed, today = query.with_entities(
+        func.count(Document.id),
+        func.sum(case((Document.is_viewed.is_(True), 1), else_=0)),
+        func.sum(case((Document.upload_datetime >= today_start, 1), else_=0))
+    ).one()
+    reviewed = reviewed or 0
+    return jsonify({'total': total, 'reviewed': reviewed, 'pending': total - reviewed, 'today': today or 0}), 200
+
+MAX_SEARCH_OFFSET = 10000
+
+
+@admin_bp.route('/documents/search', methods=['GET'])
+@jwt_required()
+def search_all_documents():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Missing query'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        offset = min(max(int(request.args.get('offset', 0)), 0), MAX_SEARCH_OFFSET)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit or offset'}), 400
+    # Ranked results can't be keyset-paged on a stable key, so page by offset
+    rows = search_documents(db, q, limit + 1, offset)
+    has_more = len(rows) > limit
     result = []
-    for d in docs:
-        u = User.query.get(d.user_id)
-        result.append({
-            'id': d.id,
-            'user_name': u.name if u else '',
-            'title': d.title,
-            'upload_datetime': d.upload_datetime,
-            'filename': d.filename,
-            'is_viewed': d.is_viewed,
-            'admin_comment': d.admin_comment
-        })
-    return jsonify(result), 200
+    for d, owner_name, rank in rows[:limit]:
+        result.append({**document_item(d, owner_name), 'description': d.description, 'rank': rank})
+    return jsonify({'results': result, 'next_offset': offset + limit if has_more else None}), 200
+
+def change_page(cursor, limit=changes.DEFAULT_PAGE_SIZE):
+    query = db.session.query(Document, User.name).join(User, Document.user_id == User.id)
+    page, error = changes.changes_since(query, DocumentTombstone.query, cursor, limit)
+    if error:
+        return None, error
+    page['changes'] = [document_item(d, owner_name) for d, owner_name in page.pop('rows')]
+    return page, None
+
+
+@admin_bp.route('/documents/changes', methods=['GET'])
+@jwt_required()
+def document_changes():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return jsonify({'error': 'Missing cursor'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', changes.DEFAULT_PAGE_SIZE)), 1), changes.MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    page, error = change_page(cursor, limit)
+    if error:
+        return error
+    return jsonify(page), 200
+
+# EventSource can't send an Authorization header, so this route also takes the
+# token as ?jwt=; the default access token lifetime keeps that short-lived
+@admin_bp.route('/documents/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_document_changes():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    # EventSource sends the id of the last event it got when it reconnects
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor') or changes.head_cursor()
+    _, error = change_page(cursor, 1)
+    if error:
+        return error
+    db.session.rollback()
+    # Each open stream holds a worker thread
+    if not changes.acquire_stream_slot():
+        return jsonify({'error': 'Too many open streams'}), 503, {'Retry-After': '10'}
+
+    def poll(cursor):
+        page, _ = change_page(cursor)
+        return page
+
+    response = Response(stream_with_context(changes.event_stream(poll, cursor)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(changes.release_stream_slot)
+    return response
+
+class ZipStream:
+    """Write-only file object that hands zipfile's output to a generator.
+
+    It has no tell()/seek(), so zipfile writes data descriptors instead of
+    seeking back, and nothing is ever buffered beyond the current chunk.
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive_name(owner_name, doc):
+    def safe(part):
+        return (part or 'unknown').replace('/', '_').replace('\\', '_')
+    return f"{safe(owner_name)}/{doc.id}_{safe(doc.filename)}"
+
+
+MANIFEST_COLUMNS = ['id', 'title', 'owner', 'upload_datetime', 'path', 'size', 'sha256', 'is_viewed', 'admin_comment']
+
+
+def generate_zip(query):
+    """Stream a ZIP of the (Document, owner name) rows of `query`, then manifest.csv.
+
+    Files and manifest come from two passes over the query, so neither is held
+    in memory; both are capped at the highest id present when the export began,
+    so uploads made meanwhile appear in neither.
+    """
+    out = ZipStream()
+    last_id = query.with_entities(func.max(Document.id)).scalar() or 0
+    rows = query.filter(Document.id <= last_id).order_by(Document.upload_datetime, Document.id)
+    missing = set()
+    with zipfile.ZipFile(out, 'w', compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for d, owner_name in rows.yield_per(200):
+            filepath = storage.document_path(d)
+            if not os.path.exists(filepath):
+                missing.add(d.id)  # recorded in the manifest with an empty path
+                continue
+            info = zipfile.ZipInfo(archive_name(owner_name, d), date_time=(d.upload_datetime or datetime.utcnow()).timetuple()[:6])
+            info.file_size = os.path.getsize(filepath)
+            # Uploads are mostly already-compressed media, so store them as-is
+            info.compress_type = zipfile.ZIP_STORED
+            with open(filepath, 'rb') as src, zf.open(info, 'w', force_zip64=info.file_size > zipfile.ZIP64_LIMIT) as dst:
+                while True:
+                    buf = src.read(storage.COPY_BUFFER_SIZE)
+                    if not buf:
+                        break
+                    dst.write(buf)
+                    yield out.drain()
+            yield out.drain()
+        info = zipfile.ZipInfo('manifest.csv', date_time=datetime.utcnow().timetuple()[:6])
+        info.compress_type = zipfile.ZIP_DEFLATED
+        with zf.open(info, 'w') as dst:
+            text = io.TextIOWrapper(dst, encoding='utf-8', newline='', write_through=True)
+            writer = csv.writer(text)
+            writer.writerow(MANIFEST_COLUMNS)
+            for d, owner_name in rows.yield_per(200):
+                writer.writerow([d.id, d.title, owner_name, d.upload_datetime.isoformat() if d.upload_datetime else '',
+                                 '' if d.id in missing else archive_name(owner_name, d),
+                                 d.size, d.sha256, d.is_viewed, d.admin_comment or ''])
+                yield out.drain()
+            text.detach()
+    yield out.drain()
+
+
+# Downloaded by navigating to the URL so the browser streams it to disk,
+# which can't send an Authorization header; the token may come as ?jwt=
+@admin_bp.route('/documents/export', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def export_documents():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    query, error = filtered_documents()
+    if error:
+        return error
+    filename = f"docky-export-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.zip"
+    return Response(
+        stream_with_context(generate_zip(query)),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
 
 @admin_bp.route('/documents/<int:doc_id>', methods=['PUT'])
 @jwt_required()
@@ -61,3 +320,106 @@ def update_document(doc_id):
     doc.admin_comment = data.get('admin_comment', doc.admin_comment)
     db.session.commit()
     return jsonify({'message': 'Updated'}), 200
+
+MAX_BULK_ITEMS = 1000
+BULK_FIELDS = ('is_viewed', 'admin_comment')
+
+
+def item_id(item):
+    doc_id = item.get('id') if isinstance(item, dict) else item
+    if isinstance(doc_id, bool) or not isinstance(doc_id, int):
+        return None
+    return doc_id
+
+
+@admin_bp.route('/documents/bulk', methods=['PUT'])
+@jwt_required()
+def bulk_update_documents():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    patches = (request.json or {}).get('documents')
+    if not isinstance(patches, list) or not patches:
+        return jsonify({'error': 'Missing documents'}), 400
+    if len(patches) > MAX_BULK_ITEMS:
+        return jsonify({'error': f'At most {MAX_BULK_ITEMS} documents per request'}), 413
+    ids = [i for i in map(item_id, patches) if i is not None]
+    existing = {row.id for row in db.session.query(Document.id).filter(Document.id.in_(ids))}
+    # executemany needs the same columns in every row, so group patches by the fields they set
+    batches = {}
+    results = []
+    for patch in patches:
+        doc_id = item_id(patch)
+        if doc_id is None:
+            results.append({'id': patch.get('id') if isinstance(patch, dict) else patch, 'status': 'invalid'})
+            continue
+        if doc_id not in existing:
+            results.append({'id': doc_id, 'status': 'not_found'})
+            continue
+        values = {k: patch[k] for k in BULK_FIELDS if k in patch}
+        # A bad value would fail the whole executemany, so reject it per item
+        if (not values
+                or ('is_viewed' in values and not isinstance(values['is_viewed'], bool))
+                or ('admin_comment' in values and not isinstance(values['admin_comment'], (str, type(None))))):
+            results.append({'id': doc_id, 'status': 'invalid'})
+            continue
+        batches.setdefault(tuple(sorted(values)), []).append({'id': doc_id, **values})
+        results.append({'id': doc_id, 'status': 'updated'})
+    for rows in batches.values():
+        db.session.execute(update(Document), rows)
+    db.session.commit()
+    return jsonify({'results': results}), 200
+
+
+def delete_documents(ids):
+    """Delete documents, their jobs and their file references; returns deleted ids."""
+    docs = Document.query.filter(Document.id.in_(ids)).all()
+    legacy_files = []
+    for doc in docs:
+        if doc.sha256:
+            storage.release(doc.sha256)
+        else:
+            legacy_files.append(storage.document_path(doc))
+    found = [doc.id for doc in docs]
+    if found:
+        changes.record_deletions(docs)
+        Job.query.filter(Job.document_id.in_(found)).delete(synchronize_session=False)
+        Document.query.filter(Document.id.in_(found)).delete(synchronize_session=False)
+    db.session.commit()
+    # Pre-blob-store files belong to exactly one document
+    for path in legacy_files:
+        if os.path.exists(path):
+            os.remove(path)
+    return found
+
+
+@admin_bp.route('/documents/<int:doc_id>', methods=['DELETE'])
+@jwt_required()
+def delete_document(doc_id):
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    if not delete_documents([doc_id]):
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify({'message': 'Deleted'}), 200
+
+@admin_bp.route('/documents/bulk', methods=['DELETE'])
+@jwt_required()
+def bulk_delete_documents():
+    user = get_jwt_identity()
+    if user['user_type'] != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    items = (request.json or {}).get('ids')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Missing ids'}), 400
+    if len(items) > MAX_BULK_ITEMS:
+        return jsonify({'error': f'At most {MAX_BULK_ITEMS} documents per request'}), 413
+    deleted = set(delete_documents([i for i in map(item_id, items) if i is not None]))
+    results = []
+    for item in items:
+        doc_id = item_id(item)
+        if doc_id is None:
+            results.append({'id': item, 'status': 'invalid'})
+        else:
+            results.append({'id': doc_id, 'status': 'deleted' if doc_id in deleted else 'not_found'})
+    return jsonify({'results': results}), 200
@@ -1,11 +1,32 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token
-from app import db
+from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from app import db, app
 from models import User
+from instrumentation import logger
 
 auth_bp = Blueprint('auth', __name__)
 
+
+def hash_password(password):
+    return generate_password_hash(password, method=app.config['PASSWORD_HASH_METHOD'])
+
+
+# The configured method as Werkzeug writes it (defaults filled in), e.g. 'pbkdf2:sha256:600000'
+CURRENT_HASH_METHOD = hash_password('').split('$', 1)[0]
+
+
+def needs_rehash(hashed_password):
+    return hashed_password.split('$', 1)[0] != CURRENT_HASH_METHOD
+
+
+def issue_tokens(identity):
+    # Role and id travel in the token, so protected routes never look the user up
+    return {
+        'token': create_access_token(identity=identity),
+        'refresh_token': create_refresh_token(identity=identity)
+    }
+
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     data = request.json
@@ -19,7 +40,7 @@ def signup():
         return jsonify({'error': 'Missing fields'}), 400
     if User.query.filter_by(email=email).first():
         return jsonify({'error': 'Email already exists'}), 409
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     user = User(name=name, email=email, hashed_password=hashed_password, user_type=user_type)
     db.session.add(user)
     db.session.commit()
@@ -27,37 +48,47 @@ def signup():
 
 @auth_bp.route('/login', methods=['POST'])
 def login():
-    print("--- Login attempt received ---")
     try:
         data = request.json
         email = data.get('email')
         password = data.get('password')
         user_type = data.get('user_type', 'user')
-        print(f"Attempting login for email: {email}, user_type: {user_type}")
+        logger.debug('login attempt', extra={'fields': {'email': email, 'user_type': user_type}})
 
         if user_type == 'admin':
             if email != 'admin@docky.com':
-                print("Admin login attempt for non-admin email. Denying.")
+                logger.info('login denied: admin login for non-admin email', extra={'fields': {'email': email}})
                 return jsonify({'error': 'Unauthorized admin login'}), 403
 
         user = User.query.filter_by(email=email, user_type=user_type).first()
 
         if not user:
-            print(f"User '{email}' not found in database. Denying.")
+            logger.info('login denied: user not found', extra={'fields': {'email': email}})
             return jsonify({'error': 'Invalid credentials - user not found'}), 401
 
-        print(f"User '{email}' found. Checking password.")
         if not check_password_hash(user.hashed_password, password):
-            print(f"Password for user '{email}' does not match. Denying.")
+            logger.info('login denied: password mismatch', extra={'fields': {'email': email}})
             return jsonify({'error': 'Invalid credentials - password mismatch'}), 401
 
-        print(f"Login successful for user '{email}'. Generating token.")
-        token = create_access_token(identity={'id': user.id, 'user_type': user.user_type})
-        response_data = {'token': token, 'user_type': user.user_type, 'name': user.name}
-        print(f"Returning token for user '{email}'.")
+        if needs_rehash(user.hashed_password):
+            # Move the stored hash to the configured cost now that we know the password
+            user.hashed_password = hash_password(password)
+            db.session.commit()
+        response_data = {**issue_tokens({'id': user.id, 'user_type': user.user_type}),
+                         'user_type': user.user_type, 'name': user.name}
+        logger.info('login succeeded', extra={'fields': {'email': email, 'user_id': user.id}})
         return jsonify(response_data), 200
-    except Exception as e:
-        print(f"!!! An unexpected error occurred in login function: {str(e)}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        logger.exception('login failed with an unexpected error')
         return jsonify({'error': 'A server error occurred'}), 500
+
+@auth_bp.route('/refresh', methods=['POST'])
+@jwt_required(refresh=True)
+def refresh():
+    # The one place claims are re-checked: a deleted user or changed role takes
+    # effect here, at most one access-token lifetime later
+    claims = get_jwt_identity()
+    user = db.session.get(User, claims.get('id')) if isinstance(claims, dict) else None
+    if not user:
+        return jsonify({'error': 'User no longer exists'}), 401
+    return jsonify({'token': create_access_token(identity={'id': user.id, 'user_type': user.user_type})}), 200
@@ -1,13 +1,27 @@
-from flask import Blueprint, request, jsonify, send_from_directory, send_file
+from flask import Blueprint, request, jsonify, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db, app
-from models import Document, User, Settings
+from models import Document, User, Upload, Job, DocumentTombstone
+import storage
+from tasks import enqueue_post_upload
+from routes.settings import get_settings
+import changes
 import os
+import uuid
+import hashlib
 from datetime import datetime
+from sqlalchemy.orm import load_only
+from mimetypes import guess_type
+from urllib.parse import quote
 
 documents_bp = Blueprint('documents', __name__)
 
 
+def deadline_passed():
+    settings = get_settings(verify=True)
+    return bool(settings and settings.deadline_datetime and datetime.utcnow() > settings.deadline_datetime)
+
+
 @documents_bp.route('/upload', methods=['OPTIONS', 'POST'])
 @jwt_required()
 def upload_document():
@@ -24,17 +38,161 @@ def upload_document():
     if not all([title, file]):
         return jsonify({'error': 'Missing fields'}), 400
     # Check deadline
-    settings = Settings.query.first()
-    if settings and settings.deadline_datetime and datetime.utcnow() > settings.deadline_datetime:
+    if deadline_passed():
         return jsonify({'error': 'Deadline passed'}), 403
     filename = f"{user_id}_{int(datetime.utcnow().timestamp())}_{file.filename}"
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(filepath)
-    doc = Document(user_id=user_id, title=title, description=description, filename=filename)
+    try:
+        digest, size = storage.store_stream(file.stream, limit=app.config['MAX_UPLOAD_SIZE'])
+    except ValueError:
+        return jsonify({'error': 'File too large'}), 413
+    doc = Document(user_id=user_id, title=title, description=description, filename=filename,
+                   size=size, sha256=digest)
     db.session.add(doc)
+    enqueue_post_upload(doc)
     db.session.commit()
     return jsonify({'message': 'Upload successful'}), 201
 
+# Chunked uploads: POST /uploads to start, PUT each chunk in order, then
+# POST /uploads/<id>/complete. GET /uploads/<id> tells a client where to resume.
+
+def upload_status(upload):
+    return {
+        'upload_id': upload.id,
+        'chunk_size': app.config['UPLOAD_CHUNK_SIZE'],
+        'next_chunk': upload.next_chunk,
+        'received_bytes': upload.received_bytes
+    }
+
+
+def get_own_upload(upload_id, user):
+    upload = Upload.query.get_or_404(upload_id)
+    if upload.user_id != user['id']:
+        return None
+    return upload
+
+
+@documents_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def init_upload():
+    user = get_jwt_identity()
+    if not user or 'id' not in user:
+        return jsonify({'error': 'Invalid or missing token'}), 401
+    data = request.json or {}
+    title = data.get('title')
+    filename = data.get('filename')
+    total_size = data.get('size')
+    if not all([title, filename]):
+        return jsonify({'error': 'Missing fields'}), 400
+    if total_size is not None and (not isinstance(total_size, int) or total_size < 0):
+        return jsonify({'error': 'Invalid size'}), 400
+    if total_size is not None and total_size > app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'error': 'File too large'}), 413
+    if deadline_passed():
+        return jsonify({'error': 'Deadline passed'}), 403
+    upload = Upload(id=uuid.uuid4().hex, user_id=user['id'], title=title,
+                    description=data.get('description'),
+                    original_filename=os.path.basename(filename), total_size=total_size)
+    open(storage.temp_path(upload.id), 'wb').close()
+    db.session.add(upload)
+    db.session.commit()
+    return jsonify(upload_status(upload)), 201
+
+@documents_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    upload = get_own_upload(upload_id, get_jwt_identity())
+    if not upload:
+        return jsonify({'error': 'Unauthorized'}), 403
+    return jsonify(upload_status(upload)), 200
+
+@documents_bp.route('/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+@jwt_required()
+def put_chunk(upload_id, index):
+    upload = get_own_upload(upload_id, get_jwt_identity())
+    if not upload:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if index < upload.next_chunk:
+        # Already stored; a client retrying after a lost response lands here
+        return jsonify(upload_status(upload)), 200
+    if index > upload.next_chunk:
+        return jsonify({'error': 'Chunk out of order', **upload_status(upload)}), 409
+    remaining = app.config['MAX_UPLOAD_SIZE'] - upload.received_bytes
+    if upload.total_size is not None:
+        # The declared size is binding; complete_upload checks it too late to stop a runaway client
+        remaining = min(remaining, upload.total_size - upload.received_bytes)
+    limit = min(app.config['UPLOAD_CHUNK_SIZE'], remaining)
+    hasher = hashlib.sha256()
+    with open(storage.temp_path(upload.id), 'r+b') as out:
+        # Drop anything left behind by an earlier attempt at this chunk
+        out.truncate(upload.received_bytes)
+        out.seek(upload.received_bytes)
+        try:
+            size = storage.copy_stream(request.stream, out, limit=limit, hasher=hasher)
+        except ValueError:
+            out.truncate(upload.received_bytes)
+            return jsonify({'error': 'Chunk too large', **upload_status(upload)}), 413
+        if size == 0:
+            return jsonify({'error': 'Empty chunk', **upload_status(upload)}), 400
+        expected = request.headers.get('X-Chunk-SHA256')
+        if expected and expected.lower() != hasher.hexdigest():
+            out.truncate(upload.received_bytes)
+            return jsonify({'error': 'Chunk checksum mismatch'}), 400
+        out.flush()
+        os.fsync(out.fileno())
+    upload.received_bytes += size
+    upload.next_chunk += 1
+    db.session.commit()
+    return jsonify({**upload_status(upload), 'chunk_sha256': hasher.hexdigest()}), 200
+
+@documents_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def complete_upload(upload_id):
+    upload = get_own_upload(upload_id, get_jwt_identity())
+    if not upload:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if upload.total_size is not None and upload.received_bytes != upload.total_size:
+        return jsonify({'error': 'Upload incomplete', **upload_status(upload)}), 409
+    if deadline_passed():
+        return jsonify({'error': 'Deadline passed'}), 403
+    part = storage.temp_path(upload.id)
+    digest = storage.file_sha256(part)
+    expected = (request.get_json(silent=True) or {}).get('sha256')
+    if expected and expected.lower() != digest:
+        return jsonify({'error': 'Checksum mismatch', 'sha256': digest}), 400
+    filename = f"{upload.user_id}_{int(datetime.utcnow().timestamp())}_{upload.original_filename}"
+    storage.store_file(part, digest, upload.received_bytes)
+    doc = Document(user_id=upload.user_id, title=upload.title, description=upload.description,
+                   filename=filename, size=upload.received_bytes, sha256=digest)
+    db.session.add(doc)
+    enqueue_post_upload(doc)
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify({'message': 'Upload successful', 'id': doc.id, 'size': doc.size, 'sha256': digest}), 201
+
+@documents_bp.route('/uploads/<upload_id>', methods=['DELETE'])
+@jwt_required()
+def abort_upload(upload_id):
+    upload = get_own_upload(upload_id, get_jwt_identity())
+    if not upload:
+        return jsonify({'error': 'Unauthorized'}), 403
+    if os.path.exists(storage.temp_path(upload.id)):
+        os.remove(storage.temp_path(upload.id))
+    db.session.delete(upload)
+    db.session.commit()
+    return jsonify({'message': 'Upload aborted'}), 200
+
+def my_document_item(d):
+    return {
+        'id': d.id,
+        'title': d.title,
+        'upload_datetime': d.upload_datetime,
+        'is_viewed': d.is_viewed,
+        'admin_comment': d.admin_comment,
+        'filename': d.filename,
+        'file_type': d.mime_type or guess_type(d.filename)[0],
+        'version': d.version
+    }
+
 @documents_bp.route('/my', methods=['GET'])
 @jwt_required()
 def my_documents():
@@ -42,45 +200,119 @@ def my_documents():
     if not user or 'id' not in user:
         return jsonify({'error': 'Invalid or missing token'}), 401
     try:
+        changes_cursor = changes.head_cursor()
         docs = Document.query.filter_by(user_id=user['id']).all()
-        result = []
-        for d in docs:
-            result.append({
-                'id': d.id,
-                'title': d.title,
-                'upload_datetime': d.upload_datetime,
-                'is_viewed': d.is_viewed,
-                'admin_comment': d.admin_comment,
-                'filename': d.filename
-            })
-        return jsonify(result), 200
+        return jsonify([my_document_item(d) for d in docs]), 200, {'X-Changes-Cursor': changes_cursor}
     except Exception as e:
         return jsonify({'error': 'Failed to fetch documents', 'details': str(e)}), 400
 
+@documents_bp.route('/my/changes', methods=['GET'])
+@jwt_required()
+def my_document_changes():
+    user = get_jwt_identity()
+    if not user or 'id' not in user:
+        return jsonify({'error': 'Invalid or missing token'}), 401
+    cursor = request.args.get('cursor')
+    if not cursor:
+        return jsonify({'error': 'Missing cursor'}), 400
+    page, error = changes.changes_since(
+        Document.query.filter_by(user_id=user['id']),
+        DocumentTombstone.query.filter_by(user_id=user['id']),
+        cursor
+    )
+    if error:
+        return error
+    page['changes'] = [my_document_item(d) for d in page.pop('rows')]
+    return jsonify(page), 200
+
+def content_disposition(kind, filename):
+    # Same encoding rules as send_file: plain ASCII names, RFC 5987 otherwise
+    try:
+        filename.encode('ascii')
+        return '{}; filename="{}"'.format(kind, filename.replace('\\', '\\\\').replace('"', '\\"'))
+    except UnicodeEncodeError:
+        return f"{kind}; filename*=UTF-8''{quote(filename)}"
+
+
+def accel_redirect(doc, filepath, mimetype=None, as_attachment=False, download_name=None):
+    """Let nginx stream the file: only headers are produced here."""
+    relpath = os.path.relpath(filepath, app.config['UPLOAD_FOLDER'])
+    response = app.response_class(mimetype=mimetype or guess_type(download_name or doc.filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = quote(app.config['X_ACCEL_PREFIX'] + relpath.replace(os.sep, '/'))
+    if as_attachment or download_name:
+        kind = 'attachment' if as_attachment else 'inline'
+        response.headers['Content-Disposition'] = content_disposition(kind, download_name or doc.filename)
+    # No validators here: nginx adds its own ETag and Last-Modified and
+    # evaluates If-None-Match and If-Range against them; ours would never match
+    return response
+
+
+def send_document(doc, filepath, **kwargs):
+    """send_file with a strong content-hash ETag.
+
+    send_file already answers Range requests with 206 and If-None-Match /
+    If-Modified-Since with 304; the files are private, so caches must
+    revalidate before reusing them. In 'x-sendfile' mode send_file emits the
+    header itself (USE_X_SENDFILE); in 'x-accel' mode nginx serves the bytes
+    and handles the validators and conditional requests.
+    """
+    if app.config['FILE_SERVING_MODE'] == 'x-accel':
+        response = accel_redirect(doc, filepath, **kwargs)
+    else:
+        response = send_file(filepath, etag=doc.sha256 or True, conditional=True, **kwargs)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def get_file_document(doc_id):
+    """Only the columns needed to authorize and serve a file.
+
+    Ownership is then checked against the JWT claims, so serving a file costs
+    this one narrow query and no user lookup.
+    """
+    columns = load_only(Document.id, Document.user_id, Document.filename, Document.sha256)
+    return Document.query.options(columns).get_or_404(doc_id)
+
 @documents_bp.route('/download/<int:doc_id>', methods=['GET'])
 @jwt_required()
 def download_document(doc_id):
     user = get_jwt_identity()
-    doc = Document.query.get_or_404(doc_id)
+    doc = get_file_document(doc_id)
     # Allow admin to download any file, user only their own
     if user['user_type'] != 'admin' and doc.user_id != user['id']:
         return jsonify({'error': 'Unauthorized'}), 403
-    return send_from_directory(app.config['UPLOAD_FOLDER'], doc.filename, as_attachment=True)
+    filepath = storage.document_path(doc)
+    if not os.path.exists(filepath):
+        return jsonify({'error': 'File not found'}), 404
+    return send_document(doc, filepath, as_attachment=True, download_name=doc.filename)
 
 @documents_bp.route('/view/<int:doc_id>', methods=['GET'])
 @jwt_required()
 def view_document(doc_id):
     user = get_jwt_identity()
-    from mimetypes import guess_type
-    doc = Document.query.get_or_404(doc_id)
+    doc = get_file_document(doc_id)
     # Allow admin to view any file, user only their own
     if user['user_type'] != 'admin' and doc.user_id != user['id']:
         return jsonify({'error': 'Unauthorized'}), 403
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], doc.filename)
-    mimetype, _ = guess_type(filepath)
+    filepath = storage.document_path(doc)
+    mimetype, _ = guess_type(doc.filename)
     if not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
-    return send_file(filepath, mimetype=mimetype or 'application/octet-stream')
+    # The blob path is named by its hash, so name the stored file explicitly
+    return send_document(doc, filepath, mimetype=mimetype or 'application/octet-stream', download_name=doc.filename)
+
+@documents_bp.route('/<int:doc_id>/jobs', methods=['GET'])
+@jwt_required()
+def document_jobs(doc_id):
+    user = get_jwt_identity()
+    doc = Document.query.get_or_404(doc_id)
+    if user['user_type'] != 'admin' and doc.user_id != user['id']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    jobs = Job.query.filter_by(document_id=doc.id).order_by(Job.id).all()
+    return jsonify([
+        {'id': j.id, 'kind': j.kind, 'status': j.status, 'attempts': j.attempts, 'updated_at': j.updated_at}
+        for j in jobs
+    ]), 200
 
 @documents_bp.route('/debug-list', methods=['GET'])
 def debug_list_documents():
@@ -0,0 +1,174 @@
+from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from PIL import Image, ImageOps
+from app import app
+from routes.documents import get_file_document
+import storage
+import os
+import time
+import uuid
+import hashlib
+import threading
+from mimetypes import guess_type
+
+try:
+    import fitz  # PyMuPDF, optional: enables PDF first-page previews
+except ImportError:
+    fitz = None
+
+previews_bp = Blueprint('previews', __name__)
+
+# Longest edge in pixels for each rendition
+PREVIEW_SIZES = {'thumb': 256, 'web': 1280}
+
+# Eviction trims the cache to this fraction of PREVIEW_CACHE_SIZE, so the full
+# directory scan it needs happens once per ~10% of cache turnover, not per render
+EVICT_TO = 0.9
+# Other processes' renders aren't counted locally; rescan at least this often (s)
+RESCAN_INTERVAL = 600
+
+# Process-local running total of the cache size, set by each full scan
+_usage = {'bytes': None, 'scanned': 0.0}
+_usage_lock = threading.Lock()
+
+
+def cache_dir():
+    return os.path.join(app.config['UPLOAD_FOLDER'], '.previews')
+
+
+def cache_key(doc, size):
+    # Renditions are keyed by content, so duplicate uploads share them
+    source = doc.sha256 or f"doc{doc.id}"
+    return f"{source}_{size}.jpg"
+
+
+def cache_path(doc, size):
+    # Sharded like the blob store so no directory grows to the whole cache
+    key = cache_key(doc, size)
+    shard = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(cache_dir(), shard[:2], shard[2:4], key)
+
+
+def load_source_image(doc, filepath):
+    mimetype, _ = guess_type(doc.filename)
+    if mimetype and mimetype.startswith('image/'):
+        return Image.open(filepath)
+    if mimetype == 'application/pdf' and fitz is not None:
+        with fitz.open(filepath) as pdf:
+            if pdf.page_count == 0:
+                return None
+            pix = pdf[0].get_pixmap(dpi=100)
+            return Image.frombytes('RGB', (pix.width, pix.height), pix.samples)
+    return None
+
+
+def render_preview(doc, filepath, size, target):
+    """Write a JPEG rendition of the document to target; False if unsupported."""
+    edge = PREVIEW_SIZES[size]
+    img = load_source_image(doc, filepath)
+    if img is None:
+        return False
+    with img:
+        # Let the JPEG decoder downscale while decoding instead of afterwards
+        img.draft('RGB', (edge, edge))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((edge, edge))
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        img.save(tmp, 'JPEG', quality=80, optimize=True)
+    os.replace(tmp, target)
+    return True
+
+
+def scan_previews():
+    """[(mtime, size, path)] of every cached rendition, oldest first."""
+    entries = []
+    for folder, _, names in os.walk(cache_dir()):
+        for name in names:
+            if not name.endswith('.jpg'):
+                continue
+            path = os.path.join(folder, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+    return entries
+
+
+def evict_previews(keep):
+    """Trim the cache to EVICT_TO of PREVIEW_CACHE_SIZE, least recently used first."""
+    limit = app.config['PREVIEW_CACHE_SIZE']
+    entries = scan_previews()
+    total = sum(size for _, size, _ in entries)
+    if total > limit:
+        for _, size, path in entries:
+            if total <= limit * EVICT_TO:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def account_preview(path):
+    """Add a new rendition to the running total; scan and evict only when it is due."""
+    with _usage_lock:
+        stale = _usage['bytes'] is None or time.monotonic() - _usage['scanned'] > RESCAN_INTERVAL
+        if not stale:
+            _usage['bytes'] += os.path.getsize(path)
+            if _usage['bytes'] <= app.config['PREVIEW_CACHE_SIZE']:
+                return
+        _usage['bytes'] = evict_previews(keep=path)
+        _usage['scanned'] = time.monotonic()
+
+
+def ensure_preview(doc, size):
+    """Return the cached rendition path, rendering it first if needed; None if unsupported."""
+    target = cache_path(doc, size)
+    if os.path.exists(target):
+        # mtime doubles as the LRU timestamp
+        os.utime(target)
+        return target
+    filepath = storage.document_path(doc)
+    if not os.path.exists(filepath):
+        return None
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    try:
+        rendered = render_preview(doc, filepath, size, target)
+    except Exception:
+        rendered = False
+    if not rendered:
+        return None
+    account_preview(target)
+    return target
+
+
+# Thumbnails are plain <img> tags in the dashboard listing, which can't send an
+# Authorization header, so the token may also come as ?jwt=
+@previews_bp.route('/preview/<int:doc_id>', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def preview_document(doc_id):
+    user = get_jwt_identity()
+    doc = get_file_document(doc_id)
+    # Allow admin to preview any file, user only their own
+    if user['user_type'] != 'admin' and doc.user_id != user['id']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    size = request.args.get('size', 'thumb')
+    if size not in PREVIEW_SIZES:
+        return jsonify({'error': 'Invalid size'}), 400
+    if not os.path.exists(storage.document_path(doc)):
+        return jsonify({'error': 'File not found'}), 404
+    target = ensure_preview(doc, size)
+    if not target:
+        return jsonify({'error': 'Preview not available'}), 415
+    response = send_file(target, mimetype='image/jpeg', conditional=True)
+    response.cache_control.private = True
+    response.cache_control.max_age = 86400
+    return response
@@ -1,11 +1,46 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from app import db
+from app import db, app
 from models import Settings
+from collections import namedtuple
 from datetime import datetime
+import threading
+import time
 
 settings_bp = Blueprint('settings', __name__)
 
+# Process-local copy of the settings row. Every dashboard polls the deadline
+# and every upload checks it. set_deadline bumps Settings.version and drops the
+# copy in its own process; other processes compare their copy's version with
+# a one-column SELECT and reload the row only when it changed. Dashboard reads
+# do that at most once per SETTINGS_CACHE_TTL seconds, while deadline
+# enforcement (verify=True) does it on every call, so no worker accepts or
+# rejects an upload against a stale deadline.
+SettingsSnapshot = namedtuple('SettingsSnapshot', ['deadline_datetime', 'version'])
+_cache = {'snapshot': None, 'expires': 0.0}
+_cache_lock = threading.Lock()
+
+
+def get_settings(verify=False):
+    snapshot = _cache['snapshot']
+    if snapshot is not None:
+        if not verify and time.monotonic() < _cache['expires']:
+            return snapshot
+        row = Settings.query.with_entities(Settings.version).first()
+        if (row.version or 0 if row else 0) == snapshot.version:
+            _cache['expires'] = time.monotonic() + app.config['SETTINGS_CACHE_TTL']
+            return snapshot
+    with _cache_lock:
+        s = Settings.query.first()
+        _cache['snapshot'] = SettingsSnapshot(s.deadline_datetime, s.version or 0) if s else SettingsSnapshot(None, 0)
+        _cache['expires'] = time.monotonic() + app.config['SETTINGS_CACHE_TTL']
+        return _cache['snapshot']
+
+
+def invalidate_settings():
+    with _cache_lock:
+        _cache['snapshot'] = None
+
 @settings_bp.route('/deadline', methods=['GET'])
 @jwt_required()
 def get_deadline():
@@ -13,8 +48,12 @@ def get_deadline():
     if not user or 'id' not in user:
         return jsonify({'error': 'Invalid or missing token'}), 401
     try:
-        s = Settings.query.first()
-        return jsonify({'deadline_datetime': s.deadline_datetime if s else None}), 200
+        s = get_settings()
+        response = jsonify({'deadline_datetime': s.deadline_datetime})
+        response.set_etag(f"settings-{s.version}")
+        response.cache_control.private = True
+        response.cache_control.max_age = int(app.config['SETTINGS_CACHE_TTL'])
+        return response.make_conditional(request)
     except Exception as e:
         return jsonify({'error': 'Failed to fetch deadline', 'details': str(e)}), 400
 
@@ -32,9 +71,11 @@ def set_deadline():
         return jsonify({'error': 'Invalid datetime format'}), 400
     s = Settings.query.first()
     if not s:
-        s = Settings(deadline_datetime=deadline_dt)
+        s = Settings(deadline_datetime=deadline_dt, version=1)
         db.session.add(s)
     else:
         s.deadline_datetime = deadline_dt
+        s.version = Settings.version + 1
     db.session.commit()
+    invalidate_settings()
     return jsonify({'message': 'Deadline set'}), 200
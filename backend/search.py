@@ -0,0 +1,131 @@
+"""Ranked full-text search over document titles, descriptions, comments and owners.
+
+SQLite (the default database) gets an FTS5 table, document_fts, whose rowid is
+the document id; Postgres gets a weighted tsvector column on document with a
+GIN index. In both cases database triggers keep the index current, so uploads,
+admin updates (including bulk executemany updates), deletes and user renames
+need no extra code in the routes. Other databases fall back to ILIKE.
+"""
+import re
+from sqlalchemy import text
+from models import Document, User
+
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS document_fts USING fts5(
+        title, description, admin_comment, owner_name,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')""",
+    """CREATE TRIGGER IF NOT EXISTS document_fts_insert AFTER INSERT ON document BEGIN
+        INSERT INTO document_fts(rowid, title, description, admin_comment, owner_name)
+        VALUES (new.id, new.title, new.description, new.admin_comment,
+                (SELECT name FROM "user" WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_fts_update
+    AFTER UPDATE OF title, description, admin_comment, user_id ON document BEGIN
+        DELETE FROM document_fts WHERE rowid = old.id;
+        INSERT INTO document_fts(rowid, title, description, admin_comment, owner_name)
+        VALUES (new.id, new.title, new.description, new.admin_comment,
+                (SELECT name FROM "user" WHERE id = new.user_id));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_fts_delete AFTER DELETE ON document BEGIN
+        DELETE FROM document_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS document_fts_owner AFTER UPDATE OF name ON "user" BEGIN
+        UPDATE document_fts SET owner_name = new.name
+        WHERE rowid IN (SELECT id FROM document WHERE user_id = new.id);
+    END""",
+]
+
+SQLITE_REBUILD = [
+    "DELETE FROM document_fts",
+    """INSERT INTO document_fts(rowid, title, description, admin_comment, owner_name)
+    SELECT d.id, d.title, d.description, d.admin_comment, u.name
+    FROM document d JOIN "user" u ON u.id = d.user_id""",
+]
+
+POSTGRES_SETUP = [
+    "ALTER TABLE document ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS ix_document_search_vector ON document USING GIN (search_vector)",
+    """CREATE OR REPLACE FUNCTION document_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('simple', coalesce((SELECT name FROM "user" WHERE id = NEW.user_id), '')), 'B') ||
+            setweight(to_tsvector('simple', coalesce(NEW.description, '')), 'C') ||
+            setweight(to_tsvector('simple', coalesce(NEW.admin_comment, '')), 'C');
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql""",
+    "DROP TRIGGER IF EXISTS document_search_vector ON document",
+    """CREATE TRIGGER document_search_vector BEFORE INSERT OR UPDATE OF title, description, admin_comment, user_id
+    ON document FOR EACH ROW EXECUTE FUNCTION document_search_vector_update()""",
+    """CREATE OR REPLACE FUNCTION user_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        UPDATE document SET title = title WHERE user_id = NEW.id;
+        RETURN NEW;
+    END $$ LANGUAGE plpgsql""",
+    'DROP TRIGGER IF EXISTS user_search_vector ON "user"',
+    """CREATE TRIGGER user_search_vector AFTER UPDATE OF name ON "user"
+    FOR EACH ROW EXECUTE FUNCTION user_search_vector_update()""",
+    # Backfill rows written before the trigger existed
+    "UPDATE document SET title = title WHERE search_vector IS NULL",
+]
+
+
+def init_search(db):
+    """Create the search index and its triggers; safe to run on every start."""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as conn:
+        if dialect == 'sqlite':
+            for statement in SQLITE_SETUP:
+                conn.execute(text(statement))
+            indexed = conn.execute(text("SELECT count(*) FROM document_fts")).scalar()
+            documents = conn.execute(text("SELECT count(*) FROM document")).scalar()
+            if indexed != documents:
+                for statement in SQLITE_REBUILD:
+                    conn.execute(text(statement))
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_SETUP:
+                conn.execute(text(statement))
+
+
+def fts5_query(q):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    words = re.findall(r'\w+', q, flags=re.UNICODE)
+    return ' '.join(f'"{w}"*' for w in words)
+
+
+def search_documents(db, q, limit, offset):
+    """Return [(Document, owner name, rank)] best match first; higher rank is better."""
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        match = fts5_query(q)
+        if not match:
+            return []
+        # bm25 is lower-is-better; weights follow the column order above
+        ranked = db.session.execute(text(
+            "SELECT rowid, -bm25(document_fts, 10.0, 2.0, 2.0, 5.0) AS rank FROM document_fts "
+            "WHERE document_fts MATCH :q ORDER BY rank DESC, rowid DESC LIMIT :limit OFFSET :offset"
+        ), {'q': match, 'limit': limit, 'offset': offset}).all()
+    elif dialect == 'postgresql':
+        ranked = db.session.execute(text(
+            "SELECT id, ts_rank_cd(search_vector, query) AS rank "
+            "FROM document, websearch_to_tsquery('simple', :q) query "
+            "WHERE search_vector @@ query ORDER BY rank DESC, id DESC LIMIT :limit OFFSET :offset"
+        ), {'q': q, 'limit': limit, 'offset': offset}).all()
+    else:
+        pattern = f"%{q}%"
+        rows = (db.session.query(Document.id)
+                .join(User, Document.user_id == User.id)
+                .filter(Document.title.ilike(pattern) | Document.description.ilike(pattern) |
+                        Document.admin_comment.ilike(pattern) | User.name.ilike(pattern))
+                .order_by(Document.upload_datetime.desc(), Document.id.desc())
+                .limit(limit).offset(offset).all())
+        ranked = [(row.id, 0.0) for row in rows]
+    if not ranked:
+        return []
+    ranks = {doc_id: rank for doc_id, rank in ranked}
+    position = {doc_id: i for i, (doc_id, _) in enumerate(ranked)}
+    rows = (db.session.query(Document, User.name)
+            .join(User, Document.user_id == User.id)
+            .filter(Document.id.in_(ranks)).all())
+    rows.sort(key=lambda row: position[row[0].id])
+    return [(d, owner_name, ranks[d.id]) for d, owner_name in rows]
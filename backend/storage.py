@@ -0,0 +1,220 @@
+"""Content-addressed blob store for uploaded files.
+
+Each distinct file is stored once under UPLOAD_FOLDER/blobs/ab/cd/<sha256>,
+and the blob table counts how many Documents point at it. Documents created
+before the blob store have no sha256 and still live in the flat folder under
+their own filename.
+"""
+import os
+import time
+import uuid
+import hashlib
+from datetime import datetime, timedelta
+from sqlalchemy import update, func
+from sqlalchemy.dialects import postgresql, sqlite
+from app import app, db
+from models import Blob, Upload
+
+# Read/write buffer used when streaming request bodies and files
+COPY_BUFFER_SIZE = 64 * 1024
+
+
+def copy_stream(src, dst, limit=None, hasher=None):
+    """Copy src to dst in bounded buffers and return the number of bytes copied.
+
+    Raises ValueError as soon as more than `limit` bytes have been read.
+    """
+    copied = 0
+    while True:
+        buf = src.read(COPY_BUFFER_SIZE)
+        if not buf:
+            return copied
+        copied += len(buf)
+        if limit is not None and copied > limit:
+            raise ValueError('Stream exceeds size limit')
+        if hasher is not None:
+            hasher.update(buf)
+        dst.write(buf)
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(COPY_BUFFER_SIZE)
+            if not buf:
+                return hasher.hexdigest()
+            hasher.update(buf)
+
+
+def temp_path(name=None):
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{name or uuid.uuid4().hex}.part")
+
+
+def blob_path(digest):
+    return os.path.join(app.config['UPLOAD_FOLDER'], 'blobs', digest[:2], digest[2:4], digest)
+
+
+def document_path(doc):
+    """Path of the file behind a Document, wherever it is stored."""
+    if doc.sha256 and os.path.exists(blob_path(doc.sha256)):
+        return blob_path(doc.sha256)
+    return os.path.join(app.config['UPLOAD_FOLDER'], doc.filename)
+
+
+def store_file(path, digest, size):
+    """Move a fully written temp file into the store and take a reference.
+
+    If the content is already stored the temp file is simply dropped. The
+    reference is taken in the current session, so the caller commits it along
+    with the Document that uses it.
+    """
+    # Take the reference before touching the file. gc_blobs removes a file while
+    # its DELETE still holds the row, so once this returns either the row
+    # survived with our reference or the file is already gone and placed below.
+    take_reference(digest, size)
+    target = blob_path(digest)
+    if os.path.exists(target):
+        os.remove(path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(path, target)
+        # A fresh mtime keeps gc from taking it for an orphan before the row commits
+        os.utime(target)
+    return digest
+
+
+def take_reference(digest, size):
+    """Add one reference to a blob, creating its row if needed, in one statement."""
+    now = datetime.utcnow()
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(Blob).values(sha256=digest, size=size, ref_count=1, updated_at=now)
+        # Concurrent first uploads of the same content both land here safely
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=[Blob.sha256],
+            set_={'ref_count': Blob.ref_count + 1, 'updated_at': now}
+        ))
+        return
+    claimed = db.session.execute(
+        update(Blob).where(Blob.sha256 == digest).values(ref_count=Blob.ref_count + 1, updated_at=now)
+    ).rowcount
+    if not claimed:
+        db.session.add(Blob(sha256=digest, size=size, ref_count=1))
+        db.session.flush()
+
+
+def store_stream(stream, limit=None):
+    """Stream into the store and return (sha256, size); see store_file."""
+    path = temp_path()
+    hasher = hashlib.sha256()
+    try:
+        with open(path, 'wb') as out:
+            size = copy_stream(stream, out, limit=limit, hasher=hasher)
+            out.flush()
+            os.fsync(out.fileno())
+    except Exception:
+        os.remove(path)
+        raise
+    return store_file(path, hasher.hexdigest(), size), size
+
+
+def release(digest):
+    """Drop one reference to a blob; the file is removed later by gc_blobs."""
+    if digest:
+        db.session.execute(
+            update(Blob).where(Blob.sha256 == digest)
+            .values(ref_count=Blob.ref_count - 1, updated_at=datetime.utcnow())
+        )
+
+
+def gc_blobs(grace=timedelta(hours=1), dry_run=False):
+    """Delete blobs nobody references, returning the list of removed digests.
+
+    Blobs released less than `grace` ago are kept. Each file is removed before
+    the DELETE of its row commits, so a store_file waiting on that row finds
+    the file gone and puts its own copy in place. Files in the store with no
+    row at all (an upload that failed after placing its file) are removed
+    once they are older than `grace`.
+    """
+    cutoff = datetime.utcnow() - grace
+    removed = []
+    candidates = [b.sha256 for b in Blob.query.filter(Blob.ref_count <= 0, Blob.updated_at < cutoff)]
+    if dry_run:
+        return candidates + remove_orphan_files(grace, dry_run=True)
+    for digest in candidates:
+        deleted = db.session.execute(
+            Blob.__table__.delete()
+            .where(Blob.sha256 == digest, Blob.ref_count <= 0, Blob.updated_at < cutoff)
+        ).rowcount
+        if deleted:
+            try:
+                if os.path.exists(blob_path(digest)):
+                    os.remove(blob_path(digest))
+            except OSError:
+                db.session.rollback()
+                raise
+            removed.append(digest)
+        db.session.commit()
+    removed.extend(remove_orphan_files(grace))
+    return removed
+
+
+def remove_orphan_files(grace, dry_run=False):
+    """Delete blob files older than `grace` that have no blob row."""
+    root = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+    if not os.path.isdir(root):
+        return []
+    known = {row.sha256 for row in Blob.query.with_entities(Blob.sha256)}
+    mtime_cutoff = time.time() - grace.total_seconds()
+    removed = []
+    for folder, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(folder, name)
+            if name in known or os.path.getmtime(path) >= mtime_cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed.append(name)
+    return removed
+
+
+def expire_uploads(max_age, dry_run=False):
+    """Remove chunked uploads idle for longer than `max_age`; returns their ids.
+
+    Also deletes partial files that old with no upload row, left behind by a
+    crashed request.
+    """
+    cutoff = datetime.utcnow() - max_age
+    last_active = func.coalesce(Upload.updated_at, Upload.created_at)
+    stale = [u.id for u in Upload.query.filter(last_active < cutoff)]
+    if dry_run:
+        return stale
+    expired = []
+    for upload_id in stale:
+        # Re-check in the DELETE: a chunk may have arrived since the query
+        deleted = db.session.execute(
+            Upload.__table__.delete().where(Upload.id == upload_id, last_active < cutoff)
+        ).rowcount
+        db.session.commit()
+        if deleted:
+            if os.path.exists(temp_path(upload_id)):
+                os.remove(temp_path(upload_id))
+            expired.append(upload_id)
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], '.partial')
+    if not os.path.isdir(folder):
+        return expired
+    live = {row.id for row in Upload.query.with_entities(Upload.id)}
+    mtime_cutoff = time.time() - max_age.total_seconds()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name[:-len('.part')] in live or os.path.getmtime(path) >= mtime_cutoff:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    return expired
@@ -0,0 +1,43 @@
+"""Post-upload job handlers; see jobs.py for the queue itself."""
+import os
+from mimetypes import guess_type
+from app import db
+from models import Document
+from jobs import handler, enqueue
+import storage
+
+try:
+    import magic  # python-magic, needs libmagic at runtime
+except ImportError:
+    magic = None
+
+# Jobs queued for every new Document, in order
+POST_UPLOAD_JOBS = ('sniff_mime', 'render_previews')
+
+
+def enqueue_post_upload(doc):
+    """Queue post-upload processing for a Document that is about to be committed."""
+    db.session.flush()
+    for kind in POST_UPLOAD_JOBS:
+        enqueue(kind, document_id=doc.id)
+
+
+@handler('sniff_mime')
+def sniff_mime(job):
+    doc = db.session.get(Document, job.document_id)
+    if doc is None:
+        return
+    mime_type = None
+    if magic is not None:
+        with open(storage.document_path(doc), 'rb') as f:
+            mime_type = magic.from_buffer(f.read(2048), mime=True)
+    doc.mime_type = mime_type or guess_type(doc.filename)[0] or 'application/octet-stream'
+
+
+@handler('render_previews')
+def render_previews(job):
+    from routes.previews import ensure_preview
+    doc = db.session.get(Document, job.document_id)
+    if doc is None or not os.path.exists(storage.document_path(doc)):
+        return
+    ensure_preview(doc, 'thumb')
@@ -0,0 +1,286 @@
+"""Latency/throughput benchmark for the deadline-critical API paths.
+
+Seeds a throwaway database and upload folder with synthetic users and
+documents (utils/seed.py), then times login, upload, /api/documents/my,
+/api/admin/documents, view and download:
+
+    python utils/benchmark.py --mode client                  # Flask test client, in-process
+    python utils/benchmark.py --mode http --concurrency 16   # gunicorn + concurrent HTTP clients
+    python utils/benchmark.py --output before.json
+    python utils/benchmark.py --diff before.json after.json
+
+Every scenario reports p50/p95/p99 latency, requests per second and errors.
+Client mode also counts SQL statements per request and the process peak RSS;
+HTTP mode reports the peak RSS of the gunicorn processes.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(BACKEND_DIR)
+
+SCENARIOS = ('login', 'upload', 'my_documents', 'admin_documents', 'view', 'download')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, elapsed, errors, queries=None):
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2) if latencies else None,
+    }
+    if queries is not None:
+        result['sql_per_request'] = round(statistics.mean(queries), 2) if queries else None
+    return result
+
+
+class Scenarios:
+    """Builds one request per call for each scenario against a client adapter."""
+
+    def __init__(self, call, users, file_size):
+        self.call = call
+        self.users = users
+        self.payload = os.urandom(file_size)
+        self.tokens = {}
+        self.counter = 0
+        self.lock = threading.Lock()
+
+    def next_index(self):
+        with self.lock:
+            self.counter += 1
+            return self.counter
+
+    def login(self, email, password, user_type='user'):
+        status, body = self.call('POST', '/api/auth/login', json={'email': email, 'password': password, 'user_type': user_type})
+        if status != 200:
+            raise RuntimeError(f"login failed: {status}")
+        return {'Authorization': f"Bearer {json.loads(body)['token']}"}
+
+    def prepare(self):
+        email, password = self.users[0]
+        self.tokens['user'] = self.login(email, password)
+        self.tokens['admin'] = self.login('admin@docky.com', password, 'admin')
+        status, body = self.call('GET', '/api/documents/my', headers=self.tokens['user'])
+        self.doc_id = json.loads(body)[0]['id']
+
+    def run(self, name):
+        i = self.next_index()
+        if name == 'login':
+            email, password = self.users[i % len(self.users)]
+            return self.call('POST', '/api/auth/login', json={'email': email, 'password': password})[0]
+        if name == 'upload':
+            return self.call('POST', '/api/documents/upload', headers=self.tokens['user'],
+                             data={'title': f'bench {i}'}, files={'file': (f'bench{i}.bin', self.payload)})[0]
+        if name == 'my_documents':
+            return self.call('GET', '/api/documents/my', headers=self.tokens['user'])[0]
+        if name == 'admin_documents':
+            return self.call('GET', '/api/admin/documents', headers=self.tokens['admin'])[0]
+        if name == 'view':
+            return self.call('GET', f'/api/documents/view/{self.doc_id}', headers=self.tokens['user'])[0]
+        if name == 'download':
+            return self.call('GET', f'/api/documents/download/{self.doc_id}', headers=self.tokens['user'])[0]
+        raise ValueError(name)
+
+
+def run_scenarios(scenarios, args, concurrency, count_queries=None):
+    results = {}
+    for name in args.scenarios:
+        latencies, queries, errors = [], [], 0
+        lock = threading.Lock()
+
+        def one(_):
+            nonlocal errors
+            before = count_queries() if count_queries else 0
+            started = time.perf_counter()
+            try:
+                status = scenarios.run(name)
+            except Exception:
+                status = None
+            took = time.perf_counter() - started
+            with lock:
+                if status is None or status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(took)
+                    if count_queries:
+                        queries.append(count_queries() - before)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+        results[name] = summarize(latencies, elapsed, errors, queries if count_queries else None)
+        print(f"{name:16} {json.dumps(results[name])}", file=sys.stderr)
+    return results
+
+
+def run_client_mode(args, users):
+    from app import app, db
+    from sqlalchemy import event
+    client = app.test_client()
+    counter = {'n': 0}
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *a: counter.__setitem__('n', counter['n'] + 1))
+
+    def call(method, path, headers=None, json=None, data=None, files=None):
+        if files:
+            data = dict(data or {})
+            for field, (filename, payload) in files.items():
+                data[field] = (io.BytesIO(payload), filename)
+        res = client.open(path, method=method, headers=headers, json=json, data=data)
+        return res.status_code, res.get_data()
+
+    scenarios = Scenarios(call, users, args.file_size)
+    scenarios.prepare()
+    # The test client runs requests one at a time, so SQL counts are exact
+    results = run_scenarios(scenarios, args, 1, count_queries=lambda: counter['n'])
+    return results, {'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def process_tree_peak_rss(pid):
+    """Sum of VmHWM (peak RSS, kB) over pid and its children, Linux only."""
+    total = 0
+    pids = [pid]
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        return None
+    for p in pids:
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def run_http_mode(args, users, env):
+    import requests
+    from loadtest import free_port
+    port = free_port()
+    env = dict(env, PORT=str(port))
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    local = threading.local()
+    try:
+        for _ in range(100):
+            try:
+                requests.get(f"{base}/api/settings/deadline", timeout=5)
+                break
+            except requests.RequestException:
+                time.sleep(0.1)
+
+        def call(method, path, headers=None, json=None, data=None, files=None):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            res = local.session.request(method, base + path, headers=headers, json=json, data=data, files=files, timeout=120)
+            return res.status_code, res.content
+
+        scenarios = Scenarios(call, users, args.file_size)
+        scenarios.prepare()
+        results = run_scenarios(scenarios, args, args.concurrency)
+        return results, {'peak_rss_kb': process_tree_peak_rss(proc.pid)}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def diff(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'scenario':16} {'metric':16} {'before':>10} {'after':>10} {'change':>8}")
+    for name, metrics in after['results'].items():
+        for metric, value in metrics.items():
+            old = before['results'].get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else ''
+            print(f"{name:16} {metric:16} {old:>10} {value:>10} {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'http'], default='client')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--documents', type=int, default=5000)
+    parser.add_argument('--file-size', type=int, default=256 * 1024, help='Bytes per seeded and uploaded file')
+    parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients in http mode')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--keep', action='store_true', help='Keep the seeded database and uploads')
+    parser.add_argument('--diff', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two JSON reports')
+    args = parser.parse_args()
+    if args.diff:
+        diff(*args.diff)
+        return
+
+    workdir = tempfile.mkdtemp(prefix='docky-bench-')
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+               JOB_WORKERS='0')  # keep background jobs out of the timings
+    os.makedirs(env['UPLOAD_FOLDER'])
+    os.environ.update(env)
+    from seed import seed_synthetic
+    started = time.perf_counter()
+    users = seed_synthetic(users=args.users, documents=args.documents, file_size=args.file_size)
+    print(f"Seeded {args.users} users / {args.documents} documents in {time.perf_counter() - started:.1f}s ({workdir})", file=sys.stderr)
+
+    try:
+        if args.mode == 'client':
+            results, process = run_client_mode(args, users)
+        else:
+            results, process = run_http_mode(args, users, env)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'diff', 'keep')},
+        'process': process,
+        'results': results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
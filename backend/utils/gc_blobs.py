@@ -0,0 +1,21 @@
+import sys
+import os
+from datetime import timedelta
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from storage import gc_blobs, expire_uploads
+
+def main():
+    from app import app
+    dry_run = '--dry-run' in sys.argv
+    with app.app_context():
+        expired = expire_uploads(timedelta(hours=app.config['UPLOAD_EXPIRY_HOURS']), dry_run=dry_run)
+        removed = gc_blobs(dry_run=dry_run)
+    for upload_id in expired:
+        print(f"upload {upload_id}")
+    for digest in removed:
+        print(digest)
+    print(f"{'Would expire' if dry_run else 'Expired'} {len(expired)} abandoned upload(s).")
+    print(f"{'Would remove' if dry_run else 'Removed'} {len(removed)} unreferenced blob(s).")
+
+if __name__ == '__main__':
+    main()
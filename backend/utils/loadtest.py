@@ -0,0 +1,169 @@
+"""Concurrent upload/download load test for the documents API.
+
+Against a running server:
+    python utils/loadtest.py --url http://127.0.0.1:5000
+
+Or start gunicorn once per worker class on a throwaway database and upload
+folder and compare them (the slow downloaders mimic mobile clients):
+    python utils/loadtest.py --compare sync gthread --slow-clients 6
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import requests
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def register(base):
+    email = f"load-{uuid.uuid4().hex[:8]}@example.com"
+    requests.post(f"{base}/api/auth/signup", json={'name': 'Load Test', 'email': email, 'password': 'loadtest'}).raise_for_status()
+    res = requests.post(f"{base}/api/auth/login", json={'email': email, 'password': 'loadtest'})
+    res.raise_for_status()
+    return {'Authorization': f"Bearer {res.json()['token']}"}
+
+
+def upload(base, headers, payload, session=requests):
+    res = session.post(f"{base}/api/documents/uploads", headers=headers,
+                       json={'title': 'load', 'filename': 'load.bin', 'size': len(payload)})
+    res.raise_for_status()
+    info = res.json()
+    step = info['chunk_size']
+    for index, offset in enumerate(range(0, len(payload), step)):
+        session.put(f"{base}/api/documents/uploads/{info['upload_id']}/chunks/{index}",
+                    headers=headers, data=payload[offset:offset + step]).raise_for_status()
+    res = session.post(f"{base}/api/documents/uploads/{info['upload_id']}/complete", headers=headers)
+    res.raise_for_status()
+    return res.json()['id']
+
+
+def run_load(base, args):
+    headers = register(base)
+    payload = os.urandom(args.file_size)
+    doc_id = upload(base, headers, payload)
+    stop = time.monotonic() + args.duration
+    stats = {'upload_bytes': 0, 'download_bytes': 0, 'errors': 0, 'probe_latencies': []}
+    lock = threading.Lock()
+
+    def add(key, value):
+        with lock:
+            stats[key] += value
+
+    def downloader(rate):
+        session = requests.Session()
+        while time.monotonic() < stop:
+            try:
+                with session.get(f"{base}/api/documents/download/{doc_id}", headers=headers, stream=True, timeout=60) as res:
+                    res.raise_for_status()
+                    for chunk in res.iter_content(64 * 1024):
+                        add('download_bytes', len(chunk))
+                        if rate:
+                            time.sleep(len(chunk) / rate)
+                        if time.monotonic() >= stop:
+                            break
+            except requests.RequestException:
+                add('errors', 1)
+
+    def uploader():
+        session = requests.Session()
+        while time.monotonic() < stop:
+            try:
+                upload(base, headers, payload, session)
+                add('upload_bytes', len(payload))
+            except requests.RequestException:
+                add('errors', 1)
+
+    def prober():
+        # A cheap endpoint every dashboard polls: shows whether capacity is left
+        session = requests.Session()
+        while time.monotonic() < stop:
+            started = time.perf_counter()
+            try:
+                session.get(f"{base}/api/settings/deadline", headers=headers, timeout=60).raise_for_status()
+                with lock:
+                    stats['probe_latencies'].append(time.perf_counter() - started)
+            except requests.RequestException:
+                add('errors', 1)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=downloader, args=(0,)) for _ in range(args.downloaders)]
+    threads += [threading.Thread(target=downloader, args=(args.slow_rate,)) for _ in range(args.slow_clients)]
+    threads += [threading.Thread(target=uploader) for _ in range(args.uploaders)]
+    threads += [threading.Thread(target=prober)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    latencies = sorted(stats['probe_latencies']) or [float('nan')]
+    return {
+        'upload_mb_s': round(stats['upload_bytes'] / args.duration / 1e6, 2),
+        'download_mb_s': round(stats['download_bytes'] / args.duration / 1e6, 2),
+        'probe_requests': len(stats['probe_latencies']),
+        'probe_p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'probe_max_ms': round(latencies[-1] * 1000, 1),
+        'errors': stats['errors'],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(worker_class, workdir, args):
+    port = free_port()
+    env = dict(os.environ,
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'load.db')}",
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+               PORT=str(port), WEB_WORKER_CLASS=worker_class,
+               WEB_CONCURRENCY=str(args.workers), WEB_THREADS=str(args.threads))
+    os.makedirs(env['UPLOAD_FOLDER'], exist_ok=True)
+    proc = subprocess.Popen([sys.executable, '-m', 'gunicorn', 'app:app'], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            requests.get(f"{base}/api/settings/deadline", timeout=5)
+            return proc, base
+        except requests.RequestException:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running server')
+    parser.add_argument('--compare', nargs='+', metavar='WORKER_CLASS', help='Start gunicorn with each worker class and compare')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per run')
+    parser.add_argument('--file-size', type=int, default=4 * 1024 * 1024, help='Bytes per uploaded/downloaded file')
+    parser.add_argument('--uploaders', type=int, default=2)
+    parser.add_argument('--downloaders', type=int, default=2)
+    parser.add_argument('--slow-clients', type=int, default=4, help='Downloaders throttled to --slow-rate')
+    parser.add_argument('--slow-rate', type=int, default=256 * 1024, help='Bytes/s per slow client')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers for --compare')
+    parser.add_argument('--threads', type=int, default=8, help='gunicorn threads for --compare')
+    args = parser.parse_args()
+    if args.url:
+        print(json.dumps({'url': args.url, **run_load(args.url.rstrip('/'), args)}))
+        return
+    for worker_class in args.compare or ['sync', 'gthread']:
+        with tempfile.TemporaryDirectory() as workdir:
+            proc, base = start_server(worker_class, workdir, args)
+            try:
+                print(json.dumps({'worker_class': worker_class, **run_load(base, args)}), flush=True)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+if __name__ == '__main__':
+    main()
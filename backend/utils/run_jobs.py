@@ -0,0 +1,16 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from jobs import worker_loop, run_pending
+
+def main():
+    from app import app
+    if '--once' in sys.argv:
+        with app.app_context():
+            print(f"Ran {run_pending()} job(s).")
+        return
+    print('Processing jobs, Ctrl+C to stop.')
+    worker_loop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+from sqlalchemy import inspect, text
+
+
+def upgrade_schema(db):
+    """Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables, so columns and indexes that
+    were added to a model after its table was first created are added here.
+    New columns must be nullable or carry a server_default.
+    """
+    engine = db.engine
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    if isinstance(default, str):
+                        default = f"'{default}'"
+                    else:
+                        default = default.compile(dialect=engine.dialect)
+                    ddl += f' DEFAULT {default}'
+                conn.execute(text(ddl))
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
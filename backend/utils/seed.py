@@ -1,8 +1,10 @@
 import sys
 import os
+import io
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from app import db
-from models import User, Document, Settings
+from search import init_search
+from models import User, Document, Settings, Blob
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 
@@ -11,6 +13,7 @@ def seed():
     with app.app_context():
         db.drop_all()
         db.create_all()
+        init_search(db)
         # Create admin
         admin = User(name='Admin', email='admin@docky.com', hashed_password=generate_password_hash('admin123'), user_type='admin')
         db.session.add(admin)
@@ -31,6 +34,45 @@ def seed():
         db.session.add(doc2)
         db.session.commit()
 
+def seed_synthetic(users=100, documents=1000, file_size=64 * 1024, distinct_files=20, password='password'):
+    """Replace the database with N users and M documents for benchmarking.
+
+    Documents cycle through `distinct_files` random payloads of `file_size`
+    bytes, stored through the blob store like real uploads. Returns the list
+    of (email, password) for the seeded users; the admin is admin@docky.com.
+    """
+    from app import app
+    import storage
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        init_search(db)
+        # Hash once: every user gets the same cost, seeding stays fast
+        hashed = generate_password_hash(password)
+        db.session.add(User(name='Admin', email='admin@docky.com', hashed_password=hashed, user_type='admin'))
+        people = [User(name=f'User {i}', email=f'user{i}@docky.com', hashed_password=hashed, user_type='user')
+                  for i in range(users)]
+        db.session.add_all(people)
+        db.session.flush()
+        blobs = [storage.store_stream(io.BytesIO(os.urandom(file_size))) for _ in range(distinct_files)]
+        refs = {}
+        start = datetime.utcnow() - timedelta(days=7)
+        for i in range(documents):
+            digest, size = blobs[i % len(blobs)]
+            owner = people[i % len(people)]
+            refs[digest] = refs.get(digest, 0) + 1
+            db.session.add(Document(
+                user_id=owner.id, title=f'Document {i}', description='Synthetic benchmark document',
+                filename=f'{owner.id}_{i}_doc{i}.pdf', sha256=digest, size=size,
+                upload_datetime=start + timedelta(seconds=i), is_viewed=i % 3 == 0
+            ))
+        # store_stream took one reference per payload; set the real counts
+        for digest, count in refs.items():
+            Blob.query.filter_by(sha256=digest).update({'ref_count': count})
+        db.session.add(Settings(deadline_datetime=datetime.utcnow() + timedelta(days=2)))
+        db.session.commit()
+        return [(p.email, password) for p in people]
+
 if __name__ == '__main__':
     seed()
     print('Seeded test data.')
@@ -10,10 +10,26 @@ import { ToastContainer } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
 import axios from 'axios';
 import { LoadingProvider } from './components/LoadingContext';
+import { getRefreshToken } from './utils/auth';
 
 // Set the base URL for all axios requests
 axios.defaults.baseURL = process.env.REACT_APP_API_URL;
 
+// Access tokens are short-lived: on a 401, swap the refresh token for a new
+// access token once and retry, instead of sending the user back to login
+axios.interceptors.response.use(undefined, async (error) => {
+  const original = error.config;
+  const refreshToken = getRefreshToken();
+  if (!error.response || error.response.status !== 401 || !refreshToken || !original || original._retried || original.url === '/api/auth/refresh') {
+    return Promise.reject(error);
+  }
+  original._retried = true;
+  const res = await axios.post('/api/auth/refresh', {}, { headers: { Authorization: `Bearer ${refreshToken}` } });
+  localStorage.setItem('token', res.data.token);
+  original.headers = { ...original.headers, Authorization: `Bearer ${res.data.token}` };
+  return axios(original);
+});
+
 function App() {
   return (
     <LoadingProvider>
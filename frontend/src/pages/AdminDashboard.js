@@ -1,6 +1,7 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import axios from 'axios';
 import { getToken } from '../utils/auth';
+import { applyChanges } from '../utils/changes';
 import { toast } from 'react-toastify';
 import Layout from '../components/Layout';
 import { FaFileImage, FaFilePdf, FaFileAlt, FaFileAudio, FaFileVideo, FaFileArchive, FaFile } from 'react-icons/fa';
@@ -35,6 +36,17 @@ function timeAgo(dateString) {
   return date.toLocaleString();
 }
 
+// Preview renditions exist for images, and for PDFs when the server has PyMuPDF
+function hasPreview(doc) {
+  return Boolean(doc.file_type && (doc.file_type.startsWith('image') || doc.file_type === 'application/pdf'));
+}
+
+// <img> can't send an Authorization header, so the preview route takes ?jwt=
+function thumbnailUrl(doc) {
+  const params = new URLSearchParams({ size: 'thumb', jwt: getToken() || '' });
+  return `/api/documents/preview/${doc.id}?${params}`;
+}
+
 function BackToTopButton() {
   const [visible, setVisible] = useState(false);
   useEffect(() => {
@@ -64,6 +76,7 @@ function highlightMatch(text, search) {
 
 export default function AdminDashboard() {
   const [docs, setDocs] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
@@ -72,7 +85,14 @@ export default function AdminDashboard() {
   const [filterStart, setFilterStart] = useState('');
   const [filterEnd, setFilterEnd] = useState('');
   const [search, setSearch] = useState('');
-  const [viewFile, setViewFile] = useState(null); // { url, title, type }
+  const [searchQuery, setSearchQuery] = useState(''); // query of the server-side search being shown
+  const [searchOffset, setSearchOffset] = useState(null);
+  const [feedCursor, setFeedCursor] = useState(null); // where the live change stream starts
+  const showingSubset = useRef(false); // server-side filter or search: don't add new rows
+  const [summary, setSummary] = useState({ total: 0, today: 0, reviewed: 0, pending: 0 });
+  const summaryFilters = useRef({});
+  const summaryFetchedAt = useRef(0);
+  const [viewFile, setViewFile] = useState(null); // { url, title, type, doc, preview }
   const [editComments, setEditComments] = useState({}); // { [docId]: comment }
   const [editTitle, setEditTitle] = useState({});
   const [editingTitleId, setEditingTitleId] = useState(null);
@@ -85,7 +105,70 @@ export default function AdminDashboard() {
     fetchDocs();
   }, []);
 
-  const fetchDocs = async (filters = {}) => {
+  // Live updates: changes since the last full fetch are pushed over server-sent
+  // events instead of re-fetching the list. The stream ends every few minutes
+  // and EventSource reconnects by itself; if it gives up (for example the token
+  // in its URL expired) catch up over plain HTTP, which refreshes the token,
+  // and reopen it.
+  useEffect(() => {
+    if (!feedCursor) return undefined;
+    let cursor = feedCursor;
+    let source = null;
+    let retry = null;
+    const apply = (page) => {
+      cursor = page.cursor;
+      setDocs(prev => applyChanges(prev, page, { insert: !showingSubset.current }));
+      // Recount at most every 10s however busy the stream is
+      if ((page.changes.length || page.deleted.length) && Date.now() - summaryFetchedAt.current > 10000) {
+        fetchSummary(summaryFilters.current);
+      }
+    };
+    const connect = () => {
+      const token = getToken();
+      if (!token) return;
+      const params = new URLSearchParams({ jwt: token, cursor });
+      source = new EventSource(`${axios.defaults.baseURL || ''}/api/admin/documents/stream?${params}`);
+      source.addEventListener('changes', e => apply(JSON.parse(e.data)));
+      source.onerror = () => {
+        if (source.readyState !== EventSource.CLOSED) return;
+        axios.get('/api/admin/documents/changes', {
+          headers: { Authorization: `Bearer ${getToken()}` },
+          params: { cursor }
+        }).then(res => {
+          apply(res.data);
+          retry = setTimeout(connect, 10000);
+        }).catch(err => {
+          // 410: the cursor is too old to catch up from
+          if (err.response && err.response.status === 410) fetchDocs();
+          else retry = setTimeout(connect, 10000);
+        });
+      };
+    };
+    connect();
+    return () => {
+      clearTimeout(retry);
+      if (source) source.close();
+    };
+  }, [feedCursor]);
+
+  // Card counts cover every matching document, not only the pages loaded so far
+  const fetchSummary = async (filters = {}) => {
+    summaryFilters.current = filters;
+    summaryFetchedAt.current = Date.now();
+    try {
+      const params = { today_start: new Date(new Date().setHours(0, 0, 0, 0)).toISOString() };
+      if (filters.user_name) params.user_name = filters.user_name;
+      if (filters.start_date) params.start_date = filters.start_date;
+      if (filters.end_date) params.end_date = filters.end_date;
+      const res = await axios.get('/api/admin/documents/summary', {
+        headers: { Authorization: `Bearer ${getToken()}` },
+        params
+      });
+      setSummary(res.data);
+    } catch (err) {}
+  };
+
+  const fetchDocs = async (filters = {}, cursor = null) => {
     setLoading(true);
     try {
       const token = getToken();
@@ -101,17 +184,52 @@ export default function AdminDashboard() {
       if (filters.end_date) params.end_date = filters.end_date;
       if (filters.file_type) params.file_type = filters.file_type;
       if (filters.status) params.status = filters.status;
+      if (cursor) params.cursor = cursor;
       const res = await axios.get('/api/admin/documents', {
         headers: { Authorization: `Bearer ${token}` },
         params
       });
-      setDocs(res.data);
+      setDocs(prev => (cursor ? [...prev, ...res.data] : res.data));
+      setNextCursor(res.headers['x-next-cursor'] || null);
+      setSearchQuery('');
+      setSearchOffset(null);
+      if (!cursor) {
+        fetchSummary(filters);
+        showingSubset.current = Boolean(filters.user_name || filters.start_date || filters.end_date);
+        setFeedCursor(res.headers['x-changes-cursor'] || null);
+      }
     } catch (err) {
       toast.error('Failed to fetch documents', { className: 'bg-red-50 text-red-800 font-semibold' });
     }
     setLoading(false);
   };
 
+  // Full-text search over titles, descriptions, comments and owners, best match first
+  const searchDocs = async (query, offset = 0) => {
+    setLoading(true);
+    try {
+      const token = getToken();
+      const res = await axios.get('/api/admin/documents/search', {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { q: query, offset }
+      });
+      setDocs(prev => (offset ? [...prev, ...res.data.results] : res.data.results));
+      showingSubset.current = true;
+      setSearchQuery(query);
+      setSearchOffset(res.data.next_offset);
+      setNextCursor(null);
+    } catch (err) {
+      toast.error('Search failed', { className: 'bg-red-50 text-red-800 font-semibold' });
+    }
+    setLoading(false);
+  };
+
+  const handleSearch = (e) => {
+    e.preventDefault();
+    if (search.trim()) searchDocs(search.trim());
+    else fetchDocs();
+  };
+
   const handleFilter = (e) => {
     e.preventDefault();
     fetchDocs({
@@ -140,31 +258,38 @@ export default function AdminDashboard() {
         headers: { Authorization: `Bearer ${token}` }
       });
       toast.success('Saved!', { className: 'bg-green-50 text-green-800 font-semibold' });
-      fetchDocs({
-        user_name: filterUser,
-        start_date: filterStart,
-        end_date: filterEnd,
-        file_type: filterType,
-        status: filterStatus
-      });
+      // The change stream brings the saved row's new version shortly
+      setDocs(prev => prev.map(d => (d.id === docId ? {
+        ...d,
+        is_viewed,
+        admin_comment: editComments[docId] !== undefined ? editComments[docId] : d.admin_comment
+      } : d)));
     } catch (err) {
       toast.error('Update failed', { className: 'bg-red-50 text-red-800 font-semibold' });
     }
     setLoading(false);
   };
 
-  const handleViewFile = async (doc) => {
+  // Images and PDFs open as a web-size preview rendition; the original is only
+  // fetched on request (or when no preview can be rendered)
+  const handleViewFile = async (doc, original = false) => {
     setLoading(true);
     try {
       const token = getToken();
-      const res = await fetch(`/api/documents/view/${doc.id}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
+      const headers = { Authorization: `Bearer ${token}` };
+      let res = null;
+      if (!original && hasPreview(doc)) {
+        res = await fetch(`/api/documents/preview/${doc.id}?size=web`, { headers });
+        if (res.status === 415) res = null;
+      }
+      const preview = Boolean(res);
+      if (!res) res = await fetch(`/api/documents/view/${doc.id}`, { headers });
       if (!res.ok) throw new Error('Failed to fetch file');
       const contentType = res.headers.get('Content-Type');
       const blob = await res.blob();
       const url = URL.createObjectURL(blob);
-      setViewFile({ url, title: doc.title, type: contentType });
+      if (viewFile) URL.revokeObjectURL(viewFile.url);
+      setViewFile({ url, title: doc.title, type: contentType, doc, preview });
     } catch (err) {
       toast.error('Could not preview file', { className: 'bg-red-50 text-red-800 font-semibold' });
     }
@@ -194,6 +319,22 @@ export default function AdminDashboard() {
     setLoading(false);
   };
 
+  // Let the browser download the export itself: it streams to disk with its own
+  // progress, where fetch + blob() would hold the whole archive in memory
+  const handleExport = () => {
+    const token = getToken();
+    if (!token) return;
+    const params = new URLSearchParams({ jwt: token });
+    if (filterUser) params.append('user_name', filterUser);
+    if (filterStart) params.append('start_date', filterStart);
+    if (filterEnd) params.append('end_date', filterEnd);
+    const a = document.createElement('a');
+    a.href = `${axios.defaults.baseURL || ''}/api/admin/documents/export?${params}`;
+    document.body.appendChild(a);
+    a.click();
+    a.remove();
+  };
+
   const handleDelete = (doc) => {
     setShowConfirm(true);
     setConfirmAction(() => async () => {
@@ -203,7 +344,7 @@ export default function AdminDashboard() {
         const token = getToken();
         await axios.delete(`/api/admin/documents/${doc.id}`, { headers: { Authorization: `Bearer ${token}` } });
         toast.success('Document deleted!', { className: 'bg-green-50 text-green-800 font-semibold' });
-        fetchDocs();
+        setDocs(prev => prev.filter(d => d.id !== doc.id));
       } catch (err) {
         toast.error('Delete failed', { className: 'bg-red-50 text-red-800 font-semibold' });
       }
@@ -212,18 +353,11 @@ export default function AdminDashboard() {
   };
 
   // Summary calculations
-  const totalDocs = docs.length;
-  const today = new Date();
-  const docsToday = docs.filter(doc => {
-    const d = new Date(doc.upload_datetime);
-    return d.toDateString() === today.toDateString();
-  }).length;
-  const reviewed = docs.filter(doc => doc.is_viewed).length;
-  const pending = docs.filter(doc => !doc.is_viewed).length;
+  const { total: totalDocs, today: docsToday, reviewed, pending } = summary;
 
   // Search filter
   const filteredDocs = docs.filter(doc =>
-    (doc.title.toLowerCase().includes(search.toLowerCase()) ||
+    (searchQuery || doc.title.toLowerCase().includes(search.toLowerCase()) ||
       (doc.user_name && doc.user_name.toLowerCase().includes(search.toLowerCase()))) &&
     (!filterType || (filterType === 'image' && doc.file_type && doc.file_type.startsWith('image')) ||
       (filterType === 'pdf' && doc.file_type === 'application/pdf') ||
@@ -241,7 +375,10 @@ export default function AdminDashboard() {
           <div className="space-y-8">
             <div className="flex justify-between items-center mb-4">
               <h2 className="text-3xl font-bold text-blue-700">Admin Dashboard</h2>
-              <a href="/admin/deadline" className="bg-blue-500 text-white px-4 py-2 rounded shadow hover:bg-blue-600 transition">Set Deadline</a>
+              <div className="flex gap-2">
+                <button type="button" onClick={handleExport} className="bg-green-500 text-white px-4 py-2 rounded shadow hover:bg-green-600 transition">Export ZIP</button>
+                <a href="/admin/deadline" className="bg-blue-500 text-white px-4 py-2 rounded shadow hover:bg-blue-600 transition">Set Deadline</a>
+              </div>
             </div>
             {/* Summary Cards */}
             <div className="grid grid-cols-1 sm:grid-cols-2 md:grid-cols-4 gap-4 mb-4">
@@ -263,15 +400,16 @@ export default function AdminDashboard() {
               </div>
             </div>
             {/* Search Bar */}
-            <div className="mb-4 flex items-center gap-2">
+            <form className="mb-4 flex items-center gap-2" onSubmit={handleSearch}>
               <input
                 type="text"
-                placeholder="Search by title or user..."
+                placeholder="Search title, description, comment or user..."
                 value={search}
                 onChange={e => setSearch(e.target.value)}
                 className="p-2 border rounded focus:ring-2 focus:ring-blue-200 w-64"
               />
-            </div>
+              <button type="submit" className="bg-blue-600 hover:bg-blue-700 text-white px-4 py-2 rounded font-semibold transition">Search</button>
+            </form>
             {/* Filter Controls */}
             <form className="flex flex-wrap gap-2 bg-white p-4 rounded-xl shadow border border-blue-100 mb-4" onSubmit={handleFilter}>
               <input type="text" placeholder="User Name" value={filterUser} onChange={e => setFilterUser(e.target.value)} className="p-2 border rounded focus:ring-2 focus:ring-blue-200" />
@@ -345,6 +483,16 @@ export default function AdminDashboard() {
                             />
                           </td>
                           <td className="p-2 flex gap-2 items-center">
+                            {hasPreview(doc) && (
+                              <img
+                                src={thumbnailUrl(doc)}
+                                alt=""
+                                loading="lazy"
+                                className="h-10 w-10 object-cover rounded border cursor-pointer"
+                                onClick={() => handleViewFile(doc)}
+                                onError={e => { e.currentTarget.style.display = 'none'; }}
+                              />
+                            )}
                             <button
                               type="button"
                               className="text-blue-500 underline"
@@ -379,6 +527,34 @@ export default function AdminDashboard() {
                       ))}
                     </tbody>
                   </table>
+                  {nextCursor && (
+                    <div className="flex justify-center mt-4">
+                      <button
+                        type="button"
+                        className="bg-blue-500 text-white px-4 py-2 rounded shadow hover:bg-blue-600 transition"
+                        onClick={() => fetchDocs({
+                          user_name: filterUser,
+                          start_date: filterStart,
+                          end_date: filterEnd,
+                          file_type: filterType,
+                          status: filterStatus
+                        }, nextCursor)}
+                      >
+                        Load more
+                      </button>
+                    </div>
+                  )}
+                  {searchOffset !== null && (
+                    <div className="flex justify-center mt-4">
+                      <button
+                        type="button"
+                        className="bg-blue-500 text-white px-4 py-2 rounded shadow hover:bg-blue-600 transition"
+                        onClick={() => searchDocs(searchQuery, searchOffset)}
+                      >
+                        Load more
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
@@ -396,6 +572,15 @@ export default function AdminDashboard() {
                     ×
                   </button>
                   <h3 className="text-lg font-bold mb-4 text-blue-700">{viewFile.title}</h3>
+                  {viewFile.preview && (
+                    <button
+                      type="button"
+                      className="text-blue-600 underline hover:text-blue-800 text-sm mb-2"
+                      onClick={() => handleViewFile(viewFile.doc, true)}
+                    >
+                      Open original
+                    </button>
+                  )}
                   <div className="w-full h-[70vh] flex items-center justify-center bg-gray-100 rounded">
                     {viewFile.type && viewFile.type.startsWith('image') ? (
                       <img src={viewFile.url} alt={viewFile.title} className="max-h-full max-w-full rounded shadow" />
@@ -23,6 +23,7 @@ export default function Login() {
       setLoading(false);
       if (res && res.data && res.data.token) {
         localStorage.setItem('token', res.data.token);
+        localStorage.setItem('refresh_token', res.data.refresh_token);
         localStorage.setItem('user_type', res.data.user_type);
         localStorage.setItem('name', res.data.name);
         toast.success('Login successful!', { className: 'bg-green-50 text-green-800 font-semibold' });
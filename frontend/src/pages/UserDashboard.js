@@ -1,10 +1,21 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import axios from 'axios';
 import { getToken } from '../utils/auth';
+import { applyChanges } from '../utils/changes';
 import { toast } from 'react-toastify';
 import Layout from '../components/Layout';
 import { FaFileUpload, FaFileAlt, FaCommentDots, FaCheckCircle, FaTimesCircle, FaCloudDownloadAlt, FaLock, FaFile, FaRegClock, FaFileImage, FaFilePdf, FaFileAudio, FaFileVideo, FaFileArchive } from 'react-icons/fa';
 
+// Attempts per chunk before an upload is given up and aborted
+const MAX_CHUNK_RETRIES = 5;
+
+// Hex SHA-256 of a chunk, or null where WebCrypto is unavailable (plain http)
+async function sha256Hex(data) {
+  if (!window.crypto || !window.crypto.subtle) return null;
+  const digest = await window.crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest), b => b.toString(16).padStart(2, '0')).join('');
+}
+
 function Badge({ children, color }) {
   const colorMap = {
     reviewed: 'bg-green-100 text-green-700',
@@ -26,6 +37,7 @@ function Spinner() {
 
 export default function UserDashboard() {
   const [docs, setDocs] = useState([]);
+  const changesCursor = useRef(null);
   const [title, setTitle] = useState('');
   const [description, setDescription] = useState('');
   const [file, setFile] = useState(null);
@@ -45,6 +57,10 @@ export default function UserDashboard() {
   useEffect(() => {
     fetchDocs();
     fetchDeadline();
+    // Pick up admin comments and review status from the change feed, which only
+    // returns rows changed since the last poll
+    const timer = setInterval(fetchChanges, 15000);
+    return () => clearInterval(timer);
   }, []);
 
   const fetchDocs = async () => {
@@ -60,12 +76,32 @@ export default function UserDashboard() {
         headers: { Authorization: `Bearer ${token}` }
       });
       setDocs(res.data);
+      changesCursor.current = res.headers['x-changes-cursor'] || null;
     } catch (err) {
       toast.error('Failed to fetch documents', { className: 'bg-red-50 text-red-800 font-semibold' });
     }
     setLoading(false);
   };
 
+  const fetchChanges = async () => {
+    if (!getToken() || !changesCursor.current) return;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const res = await axios.get('/api/documents/my/changes', {
+          headers: { Authorization: `Bearer ${getToken()}` },
+          params: { cursor: changesCursor.current }
+        });
+        setDocs(prev => applyChanges(prev, res.data));
+        changesCursor.current = res.data.cursor;
+        hasMore = res.data.has_more;
+      }
+    } catch (err) {
+      // 410: the cursor is too old to catch up from
+      if (err.response && err.response.status === 410) fetchDocs();
+    }
+  };
+
   const fetchDeadline = async () => {
     try {
       const token = getToken();
@@ -85,10 +121,7 @@ export default function UserDashboard() {
     const files = Array.from(e.target.file.files);
     let allSuccess = true;
     for (const f of files) {
-      const formData = new FormData();
-      formData.append('title', title);
-      formData.append('description', description);
-      formData.append('file', f);
+      let uploadId = null;
       try {
         const token = getToken();
         if (!token) {
@@ -96,20 +129,53 @@ export default function UserDashboard() {
           setLoading(false);
           return;
         }
-        await axios.post('/api/documents/upload', formData, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-            'Content-Type': 'multipart/form-data'
-          },
-          onUploadProgress: (progressEvent) => {
-            const percent = Math.round((progressEvent.loaded * 100) / progressEvent.total);
-            setUploadProgress(prev => ({ ...prev, [f.name]: percent }));
+        const headers = { Authorization: `Bearer ${token}` };
+        // Send the file in chunks so large uploads can resume and never hold a server worker for long
+        const init = await axios.post('/api/documents/uploads', { title, description, filename: f.name, size: f.size }, { headers });
+        const { chunk_size } = init.data;
+        uploadId = init.data.upload_id;
+        let nextChunk = init.data.next_chunk;
+        let failures = 0;
+        while (nextChunk * chunk_size < f.size) {
+          try {
+            // Hash and send the same buffer, so a file changing on disk can't slip past the check
+            const chunk = await f.slice(nextChunk * chunk_size, (nextChunk + 1) * chunk_size).arrayBuffer();
+            const checksum = await sha256Hex(chunk);
+            const chunkHeaders = { Authorization: `Bearer ${getToken()}`, 'Content-Type': 'application/octet-stream' };
+            // The server rejects the chunk without storing it if this doesn't match
+            if (checksum) chunkHeaders['X-Chunk-SHA256'] = checksum;
+            const res = await axios.put(`/api/documents/uploads/${uploadId}/chunks/${nextChunk}`, chunk, { headers: chunkHeaders });
+            nextChunk = res.data.next_chunk;
+            failures = 0;
+            setUploadProgress(prev => ({ ...prev, [f.name]: Math.round((res.data.received_bytes * 100) / (f.size || 1)) }));
+          } catch (err) {
+            // Network errors, 5xx, 409 (out of order) and a corrupted chunk are retried;
+            // other 4xx won't get better
+            const status = err.response && err.response.status;
+            const corrupted = status === 400 && err.response.data && err.response.data.error === 'Chunk checksum mismatch';
+            if ((status && status < 500 && status !== 409 && !corrupted) || ++failures > MAX_CHUNK_RETRIES) throw err;
+            await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** failures));
+            // Resume where the server is: the chunk may have landed even if its response was lost
+            try {
+              const res = await axios.get(`/api/documents/uploads/${uploadId}`, {
+                headers: { Authorization: `Bearer ${getToken()}` }
+              });
+              nextChunk = res.data.next_chunk;
+            } catch {}
           }
-        });
+        }
+        await axios.post(`/api/documents/uploads/${uploadId}/complete`, {}, { headers: { Authorization: `Bearer ${getToken()}` } });
+        uploadId = null;
         setUploadProgress(prev => ({ ...prev, [f.name]: 100 }));
         toast.success(`Uploaded ${f.name}!`, { className: 'bg-green-50 text-green-800 font-semibold' });
       } catch (err) {
         allSuccess = false;
+        // Abort so the server drops the partial file now rather than at expiry
+        if (uploadId) {
+          axios.delete(`/api/documents/uploads/${uploadId}`, {
+            headers: { Authorization: `Bearer ${getToken()}` }
+          }).catch(() => {});
+        }
         toast.error(`Failed to upload ${f.name}`, { className: 'bg-red-50 text-red-800 font-semibold' });
       }
     }
@@ -4,3 +4,9 @@ export function getToken() {
   if (!token || token === 'undefined' || token === 'null') return null;
   return token;
 }
+
+export function getRefreshToken() {
+  const token = localStorage.getItem('refresh_token');
+  if (!token || token === 'undefined' || token === 'null') return null;
+  return token;
+}
@@ -0,0 +1,20 @@
+// Merge a change feed page ({ changes, deleted }, see backend/changes.py) into
+// a document list. Deletions are applied first; a changed row replaces the copy
+// we hold only if its version is newer. Rows we don't hold yet are added at the
+// top unless `insert` is false, e.g. while the list shows filtered results.
+export function applyChanges(docs, page, { insert = true } = {}) {
+  const deleted = new Set(page.deleted);
+  const kept = docs.filter(doc => !deleted.has(doc.id));
+  const byId = new Map(kept.map(doc => [doc.id, doc]));
+  const added = [];
+  for (const change of page.changes) {
+    const current = byId.get(change.id);
+    if (current) {
+      if (!(current.version >= change.version)) byId.set(change.id, { ...current, ...change });
+    } else if (insert) {
+      byId.set(change.id, change);
+      added.unshift(change);
+    }
+  }
+  return [...added, ...kept.map(doc => byId.get(doc.id))];
+}